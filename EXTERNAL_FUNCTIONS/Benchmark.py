@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from EXTERNAL_FUNCTIONS import DataImport
+from EXTERNAL_FUNCTIONS import DatasetTreatment
+from EXTERNAL_FUNCTIONS import Robot_Portrait
+from EXTERNAL_FUNCTIONS import PlotSummaryIndex
+from EXTERNAL_FUNCTIONS import MonteCarloScoring
+from EXTERNAL_FUNCTIONS import ScoringRelatedFunctions
+
+"""
+This file contains the benchmarks used to check the speed of the loading and treatment functions.
+Each benchmark returns a dataframe with one row per measure.
+It also contains a suite timing the hot paths (loading, treatment, scoring, optimization, matching) on synthetic
+CMU-shaped corpora of several sizes and on the bundled DATA files, whose results are saved as JSON to compare runs:
+    python -m EXTERNAL_FUNCTIONS.Benchmark --sizes 10000 100000 1000000 --output benchmark.json
+"""
+
+TVTROP_FILE = './DATA/MovieSummaries/tvtropes.clusters.txt'
+PLOT_FILE = './DATA/MovieSummaries/plot_summaries.txt'
+BABY_NAME_PATH = './DATA/AddedDatasets/Name'
+DATA_PATH = './DATA/MovieSummaries'
+SUITE_SIZES = (10000, 100000, 1000000)
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run @function with the given arguments and return its result, the wall time in seconds
+    and the peak of memory allocated by python during the call (in MB).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak/1e6
+
+
+def _legacy_tvtrop_loading(tvtrop_file):
+    """
+    Former loading of the tvtropes file, with one pd.concat per line (quadratic in copies).
+    """
+    with open(tvtrop_file) as f:
+        lines = f.readlines()
+    tvtropDF = pd.DataFrame(columns=DataImport.TVTROP_COL)
+    for line in lines:
+        char_type, dico = line.split("\t")
+        dico = json.loads(dico)
+        dico["stereotype"] = char_type
+        tvtropDF = pd.concat([tvtropDF, pd.DataFrame([dico])], ignore_index=True)
+    return tvtropDF
+
+
+def benchmark_tvtrop_loading(tvtrop_file=TVTROP_FILE, n_lines_list=(500, 1000, 2000, 4000, 8000, 16000),
+                             legacy_max_lines=2000):
+    """
+    Build tvtropes files of @n_lines_list lines by repeating the records of @tvtrop_file and time their loading.
+    The time per line of OpenTvTropDF should stay constant (linear scaling) while the one of the former
+    loading grows with the number of lines. The former loading is only run up to @legacy_max_lines lines.
+    """
+    with open(tvtrop_file) as f:
+        records = [line if line.endswith("\n") else line+"\n" for line in f if line.strip()]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_lines in n_lines_list:
+            file = os.path.join(tmp_dir, f"tvtropes_{n_lines}.txt")
+            with open(file, "w") as f:
+                f.writelines(records[i % len(records)] for i in range(n_lines))
+
+            loaders = {'OpenTvTropDF': DataImport.OpenTvTropDF}
+            if n_lines <= legacy_max_lines:
+                loaders['legacy'] = _legacy_tvtrop_loading
+            for loader_name, loader in loaders.items():
+                _, seconds, peak = measure(loader, file)
+                results.append({'loader': loader_name, 'n_lines': n_lines, 'seconds': seconds,
+                                'us_per_line': seconds/n_lines*1e6, 'peak_MB': peak})
+
+    return pd.DataFrame(results)
+
+
+def _legacy_baby_name_loading(PATH):
+    """
+    Former loading of the baby name files (sequential reads and one pd.concat per file),
+    without the rewriting of the source files.
+    """
+    baby_nameDF = pd.DataFrame()
+    for file in os.listdir(PATH):
+        if file.endswith(".txt"):
+            name_a_yearDF = pd.read_table(os.path.join(PATH, file), sep=",", index_col=False)
+            name_a_yearDF = name_a_yearDF.drop_duplicates()
+            name_a_yearDF = name_a_yearDF.drop(name_a_yearDF[name_a_yearDF["Firstname"]=="Firstname"].index)
+            name_a_yearDF["Year"] = file.split(".")[0].replace("yob","")
+            baby_nameDF = pd.concat([baby_nameDF, name_a_yearDF])
+    return baby_nameDF
+
+
+def benchmark_baby_name_loading(PATH=BABY_NAME_PATH, n_workers_list=(1, 4, 8)):
+    """
+    Compare the load time, the peak memory and the size of the result of the former loading of the
+    baby name files with the ones of OpenBabyNameDf for several numbers of workers.
+    The first measure is the coldest one, the files being then in the cache of the system.
+    """
+    loaders = {'legacy': _legacy_baby_name_loading}
+    for n_workers in n_workers_list:
+        loaders[f'OpenBabyNameDf ({n_workers} workers)'] = \
+            lambda PATH, n_workers=n_workers: DataImport.OpenBabyNameDf(PATH, n_workers=n_workers)
+
+    results = []
+    for loader_name, loader in loaders.items():
+        baby_nameDF, seconds, peak = measure(loader, PATH)
+        results.append({'loader': loader_name, 'seconds': seconds, 'peak_MB': peak, 'rows': len(baby_nameDF),
+                         'result_MB': baby_nameDF.memory_usage(deep=True).sum()/1e6})
+    return pd.DataFrame(results)
+
+
+def benchmark_firstname_extraction(characterDF, baby_nameDF, column='Actor Name'):
+    """
+    Time the extraction of the top firstname of every row of @column of @characterDF (450k rows for the
+    full character metadata) with extract_top_firstname through .apply and with extract_top_firstname_batch,
+    and check that both give the same result.
+    """
+    valid_firstnames = set(baby_nameDF["Firstname"].astype(str))
+    name_occurrences = baby_nameDF.groupby("Firstname", observed=True)["Number"].sum()
+    name_occurrences_dict = dict(zip(name_occurrences.index.astype(str), name_occurrences.values))
+
+    applied, apply_seconds, apply_peak = measure(
+        characterDF[column].apply, lambda x: DatasetTreatment.extract_top_firstname(x, valid_firstnames,
+                                                                                     name_occurrences_dict))
+    vocabulary, vocabulary_seconds, _ = measure(DatasetTreatment.build_firstname_vocabulary,
+                                                valid_firstnames, name_occurrences_dict)
+    batch, batch_seconds, batch_peak = measure(DatasetTreatment.extract_top_firstname_batch,
+                                               characterDF[column], vocabulary=vocabulary)
+
+    same_result = bool((applied.fillna('') == batch.fillna('')).all())
+    return pd.DataFrame([{'method': 'apply', 'rows': len(characterDF), 'seconds': apply_seconds,
+                          'peak_MB': apply_peak, 'same_result': same_result},
+                         {'method': 'vocabulary', 'rows': len(valid_firstnames), 'seconds': vocabulary_seconds,
+                          'peak_MB': None, 'same_result': same_result},
+                         {'method': 'batch', 'rows': len(characterDF), 'seconds': batch_seconds,
+                          'peak_MB': batch_peak, 'same_result': same_result}])
+
+
+def benchmark_genre_matching(df, genre_pairs, methods=('blossom', 'assignment', 'greedy')):
+    """
+    Time the matching of the movies of each (genre1, genre2) of @genre_pairs in @df (the dataset used by
+    Robot_Portrait.Significance_of_genre) with each of @methods, and compare the total matched similarity
+    to the upper bound given by Robot_Portrait.matching_upper_bound.
+    """
+    results = []
+    for genre1, genre2 in genre_pairs:
+        (ids1, ids2, similarity), edges_seconds, _ = measure(Robot_Portrait.candidate_edges, genre1, genre2, df)
+        weights = {}
+        for id1, id2, weight in zip(ids1.tolist(), ids2.tolist(), similarity.tolist()):
+            weights[(id1, id2)] = weights[(id2, id1)] = weight
+        bound = Robot_Portrait.matching_upper_bound(ids1, ids2, similarity) if len(similarity) else 0.
+        for method in methods:
+            pairs, seconds, peak = measure(Robot_Portrait.match_edges, ids1, ids2, similarity, method)
+            total = sum(weights[pair] for pair in pairs)
+            results.append({'genre1': genre1, 'genre2': genre2, 'method': method, 'edges': len(similarity),
+                            'edges_seconds': edges_seconds, 'seconds': seconds, 'peak_MB': peak,
+                            'pairs': len(pairs), 'total_similarity': total,
+                            'bound_ratio': total/bound if bound else 1.})
+    return pd.DataFrame(results)
+
+
+def benchmark_plot_lookup(plot_file=PLOT_FILE, n_ids_list=(1, 100, 10000), seed=0):
+    """
+    Compare the time to get the plots of @n_ids_list random movies by loading the whole plot file with pd.read_csv
+    and with PlotSummaryIndex.read_plots (the one-time build of the index being measured separately).
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = os.path.join(tmp_dir, 'plot_summaries.index.npy')
+        index, build_seconds, build_peak = measure(PlotSummaryIndex.build_plot_index, plot_file, index_file)
+    results = [{'method': 'build index', 'n_ids': len(index), 'seconds': build_seconds, 'peak_MB': build_peak}]
+
+    rng = np.random.default_rng(seed)
+    for n_ids in n_ids_list:
+        movie_ids = rng.choice(index[:, 0], size=min(n_ids, len(index)), replace=False)
+        plotDF, seconds, peak = measure(lambda: DataImport.OpenDatasetFile(os.path.dirname(plot_file), 'plot')
+                                        .set_index('Wikipedia movie ID').loc[movie_ids, 'Plot'])
+        results.append({'method': 'read_csv', 'n_ids': n_ids, 'seconds': seconds, 'peak_MB': peak})
+        plots, seconds, peak = measure(PlotSummaryIndex.read_plots, movie_ids, plot_file, index)
+        results.append({'method': 'offset index', 'n_ids': n_ids, 'seconds': seconds, 'peak_MB': peak})
+    return pd.DataFrame(results)
+
+
+####################################
+#####  Benchmark suite  ############
+####################################
+
+FIRSTNAMES = ['Mary', 'John', 'James', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+              'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen']
+GENRES = ['Drama', 'Comedy', 'Romance Film', 'Thriller', 'Action', 'World cinema', 'Crime Fiction', 'Horror',
+          'Black-and-white', 'Indie', 'Action/Adventure', 'Adventure', 'Family Film', 'Short Film', 'Documentary']
+LANGUAGES = ['English Language', 'French Language', 'Hindi Language', 'Spanish Language', 'Italian Language',
+             'German Language', 'Japanese Language', 'Tamil Language', 'Silent film', 'Malayalam Language']
+COUNTRIES = ['United States of America', 'India', 'United Kingdom', 'France', 'Italy', 'Japan', 'Canada',
+             'Germany', 'Argentina', 'Hong Kong']
+
+
+def _zipf_choice(rng, values, size):
+    # A few values are much more frequent than the others, as in the CMU corpus
+    weights = 1/np.arange(1, len(values)+1)
+    return rng.choice(len(values), size=size, p=weights/weights.sum())
+
+
+def _freebase_dicts(rng, labels, prefix, n_movies, max_labels):
+    codes = [_zipf_choice(rng, labels, rng.integers(1, max_labels+1)) for _ in range(n_movies)]
+    return [json.dumps({f"/m/{prefix}{code}": labels[code] for code in movie_codes}) for movie_codes in codes]
+
+
+def synthetic_cmu_tables(n_rows, seed=0):
+    """
+    Generate CMU-shaped character (@n_rows actors), movie (one per 10 actors), plot, name and tvtropes tables,
+    with the raw formats of the corpus files (string dates, freebase json dictionaries, missing values).
+    """
+    rng = np.random.default_rng(seed)
+    n_movies = max(n_rows//10, 10)
+    movie_ids = rng.choice(40000000, size=n_movies, replace=False)
+    years = rng.integers(1910, 2013, n_movies)
+    dates = np.where(rng.random(n_movies) < 0.5, years.astype(str),
+                     pd.Series(years.astype(str))+'-'+pd.Series(rng.integers(1, 13, n_movies)).map('{:02d}'.format)+'-15')
+    movieDF = pd.DataFrame({'Wikipedia movie ID': movie_ids,
+                            'Freebase movie ID': ['/m/0'+format(int(i), 'x') for i in movie_ids],
+                            'Movie name': ['Movie '+str(i) for i in movie_ids],
+                            'Movie release date': dates,
+                            'Movie box office revenue': np.where(rng.random(n_movies) < 0.1,
+                                                                 rng.lognormal(16, 2, n_movies).round(), np.nan),
+                            'Movie runtime': np.where(rng.random(n_movies) < 0.75, rng.normal(95, 20, n_movies).round(), np.nan),
+                            'Movie languages': _freebase_dicts(rng, LANGUAGES, 'l', n_movies, 2),
+                            'Movie countries': _freebase_dicts(rng, COUNTRIES, 'c', n_movies, 2),
+                            'Movie genres': _freebase_dicts(rng, GENRES, 'g', n_movies, 4)})
+
+    movie = rng.integers(0, n_movies, n_rows)
+    birth_years = years[movie]-rng.integers(8, 80, n_rows)
+    has_dob = rng.random(n_rows) < 0.75
+    n_actors = max(n_rows//3, 1)
+    actor = rng.integers(0, n_actors, n_rows)
+    actor_names = pd.Series(np.asarray(FIRSTNAMES)[_zipf_choice(rng, FIRSTNAMES, n_actors)]) + ' Actor' + pd.Series(np.arange(n_actors)).astype(str)
+    characterDF = pd.DataFrame({'Wikipedia movie ID': movie_ids[movie],
+                                'Freebase movie ID': movieDF['Freebase movie ID'].to_numpy()[movie],
+                                'Movie release date': dates[movie],
+                                'Character Name': np.where(rng.random(n_rows) < 0.45, 'Character '+pd.Series(np.arange(n_rows)).astype(str), None),
+                                'Actor DOB': np.where(has_dob, pd.Series(birth_years).astype(str)+'-06-01', None),
+                                'Actor gender': np.asarray(['M', 'F', None], dtype=object)[rng.choice(3, n_rows, p=[0.64, 0.26, 0.1])],
+                                'Actor height': np.where(rng.random(n_rows) < 0.35, rng.normal(1.75, 0.1, n_rows).round(3), np.nan),
+                                'Actor ethnicity': np.where(rng.random(n_rows) < 0.25, '/m/0e'+pd.Series(_zipf_choice(rng, range(400), n_rows)).astype(str), None),
+                                'Actor Name': actor_names.to_numpy()[actor],
+                                'Actor age at movie release': np.where(has_dob, (years[movie]-birth_years).astype(float), np.nan),
+                                'Freebase character map': '/m/0cm'+pd.Series(np.arange(n_rows)).astype(str),
+                                'Freebase character ID': '/m/0ch'+pd.Series(np.arange(n_rows)).astype(str),
+                                'Freebase actor ID': '/m/0a'+pd.Series(actor).astype(str)})
+
+    with_plot = movie_ids[rng.random(n_movies) < 0.5]
+    plotDF = pd.DataFrame({'Wikipedia movie ID': with_plot,
+                           'Plot': ['The story of movie '+str(i)+'. '+'Something happens to the characters. '*8 for i in with_plot]})
+    named = characterDF.dropna(subset=['Character Name']).head(max(n_rows//50, 1))
+    nameDF = pd.DataFrame({'Character Name': named['Character Name'], 'Freebase character map': named['Freebase character map']})
+    tvtrop = characterDF.head(max(n_rows//100, 1))
+    tvtrop_lines = [stereotype+"\t"+json.dumps({'char': char, 'movie': 'Movie '+str(movie_id), 'id': char_id, 'actor': actor_name})
+                    for stereotype, char, movie_id, char_id, actor_name in
+                    zip(np.asarray(['dumb_muscle', 'crazy_jealous_guy', 'adventurer_archaeologist'])[np.arange(len(tvtrop)) % 3],
+                        tvtrop['Character Name'].fillna('Character'), tvtrop['Wikipedia movie ID'],
+                        tvtrop['Freebase character map'], tvtrop['Actor Name'])]
+    return {'character': characterDF, 'movie': movieDF, 'plot': plotDF, 'name': nameDF, 'tvtrop': tvtrop_lines}
+
+
+def write_synthetic_corpus(folder, n_rows, seed=0):
+    """
+    Write the tables of synthetic_cmu_tables in @folder, with the file names and formats of the CMU corpus.
+    """
+    os.makedirs(folder, exist_ok=True)
+    tables = synthetic_cmu_tables(n_rows, seed)
+    for dataset in ['character', 'movie', 'name', 'plot']:
+        tables[dataset].to_csv(os.path.join(folder, DataImport.DATASET_FILES[dataset]), sep='\t', header=False, index=False)
+    with open(os.path.join(folder, DataImport.DATASET_FILES['tvtrop']), 'w') as f:
+        f.write("\n".join(tables['tvtrop'])+"\n")
+    return folder
+
+
+def synthetic_reference():
+    """
+    Uniform reference distributions with the structure expected by representativeness_score.
+    """
+    age_bins, hei_bins = len(np.arange(0, 80, 5))-1, len(np.arange(142, 193, 3))-1
+    age = {'M': [1/75]*age_bins, 'F': [1/75]*age_bins}
+    hei = {'M': [1/51]*hei_bins, 'F': [1/hei_bins]*hei_bins}
+    return {'par': {'F': 0.5}, 'age': age, 'AGE': age, 'hei': hei, 'HEI': hei}
+
+
+def _measure_time(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start, None
+
+
+def _record(records, dataset, function, rows, unit, measured):
+    result, seconds, peak = measured
+    records.append({'dataset': dataset, 'function': function, 'rows': int(rows), 'seconds': seconds,
+                    'throughput': rows/seconds if seconds else None, 'unit': unit, 'peak_MB': peak})
+    return result
+
+
+def benchmark_corpus(PATH, label, n_pools=20, n_test=1000, legacy_n_test=20, matching_method='assignment',
+                     matching_sample=5000, seed=0, trace_memory=True):
+    """
+    Time the hot paths on the corpus stored in @PATH (the datasets whose file is missing are skipped):
+    loading of each dataset, MovieDF_Treatment, representativeness_score (@n_pools pools), scores_distribution
+    (@legacy_n_test pools) and its batched equivalent (@n_test pools), improvement and Robot_Portrait.matching
+    of the two most frequent genres (at most @matching_sample movies of each, all if None).
+    Tracing the peak memory slows down the functions allocating many python objects: with @trace_memory=False
+    only the wall time is measured. Returns a list of records (one per function).
+    """
+    measure_ = measure if trace_memory else _measure_time
+    rng = np.random.default_rng(seed)
+    records = []
+    frames = {}
+    for dataset, file in DataImport.DATASET_FILES.items():
+        if os.path.exists(os.path.join(PATH, file)):
+            measured = measure_(DataImport.OpenDatasetFile, PATH, dataset)
+            frames[dataset] = _record(records, label, 'OpenDatasetFile:'+dataset, len(measured[0]), 'rows/s', measured)
+
+    if 'movie' in frames:
+        movieDF = _record(records, label, 'MovieDF_Treatment', len(frames['movie']), 'rows/s',
+                          measure_(DatasetTreatment.MovieDF_Treatment, frames['movie']))
+
+    if 'character' in frames:
+        df = frames['character']
+        df['Ethnicity'] = df['Actor ethnicity']
+        ref = synthetic_reference()
+        movie_ids = df['Wikipedia movie ID'].unique()
+        pools = [rng.choice(movie_ids, size=min(20, len(movie_ids)), replace=False) for _ in range(n_pools)]
+        _record(records, label, 'representativeness_score', n_pools, 'pools/s',
+                measure_(lambda: [ScoringRelatedFunctions.representativeness_score(
+                    ScoringRelatedFunctions.defined_movie_pool(pool, df), ref) for pool in pools]))
+        _record(records, label, 'scores_distribution', legacy_n_test, 'pools/s',
+                measure_(ScoringRelatedFunctions.scores_distribution, 'tot', df, ref, legacy_n_test, plot=False))
+        _record(records, label, 'batched_scores_distribution', n_test, 'pools/s',
+                measure_(MonteCarloScoring.batched_scores_distribution, 'tot', df, ref, n_test, plot=False, seed=seed))
+        initial = list(pools[0][:10])
+        score = ScoringRelatedFunctions.representativeness_score(ScoringRelatedFunctions.defined_movie_pool(initial, df), ref)['tot']
+        _record(records, label, 'improvement', len(movie_ids), 'candidates/s',
+                measure_(ScoringRelatedFunctions.improvement, df, ref, initial, score))
+
+    if 'movie' in frames:
+        genresDF = movieDF.explode('Movie genres').rename(columns={'Movie genres': 'Movie_genres'})
+        genresDF['Movie_box_office_revenue_scaled'] = genresDF['Movie box office revenue']
+        genre1, genre2 = genresDF['Movie_genres'].value_counts().index[:2]
+        genresDF = genresDF[genresDF['Movie_genres'].isin([genre1, genre2])]
+        if matching_sample is not None:
+            # The number of candidate pairs grows as the product of the sizes of the genres
+            genresDF = genresDF.groupby('Movie_genres', group_keys=False).apply(
+                lambda genre: genre.sample(min(len(genre), matching_sample), random_state=seed))
+        n_movies = len(genresDF)
+        _record(records, label, 'matching:'+matching_method, n_movies, 'movies/s',
+                measure_(Robot_Portrait.matching, genre1, genre2, genresDF, matching_method))
+    return records
+
+
+def run_benchmark_suite(sizes=SUITE_SIZES, data_path=DATA_PATH, output=None, seed=0, **kwargs):
+    """
+    Run benchmark_corpus on synthetic corpora of @sizes actors and on the corpus of @data_path (if not None),
+    and save the results in the JSON file @output (with the versions of the environment) if given.
+    Returns the results as a dataframe.
+    """
+    records = []
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            write_synthetic_corpus(folder, n_rows, seed)
+            records.extend(benchmark_corpus(folder, f'synthetic-{n_rows}', seed=seed, **kwargs))
+    if data_path is not None and os.path.isdir(data_path):
+        records.extend(benchmark_corpus(data_path, 'DATA', seed=seed, **kwargs))
+
+    if output is not None:
+        metadata = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                    'platform': platform.platform(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                    'sizes': list(sizes), 'seed': seed}
+        with open(output, 'w') as f:
+            json.dump({'metadata': metadata, 'results': records}, f, indent=1)
+    return pd.DataFrame(records)
+
+
+def compare_benchmarks(baseline_file, new_file):
+    """
+    Compare two JSON files written by run_benchmark_suite: speedup (> 1 if faster) and memory ratio of each function.
+    """
+    frames = []
+    for file in [baseline_file, new_file]:
+        with open(file) as f:
+            frames.append(pd.DataFrame(json.load(f)['results']).set_index(['dataset', 'function']))
+    comparison = frames[0][['seconds', 'peak_MB']].join(frames[1][['seconds', 'peak_MB']], lsuffix='_baseline',
+                                                         rsuffix='_new', how='inner')
+    comparison['speedup'] = comparison['seconds_baseline']/comparison['seconds_new']
+    comparison['memory_ratio'] = comparison['peak_MB_new']/comparison['peak_MB_baseline']
+    return comparison.reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark suite of the hot paths of the project')
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(SUITE_SIZES), help='numbers of actors of the synthetic corpora')
+    parser.add_argument('--data', default=DATA_PATH, help="folder of the CMU corpus ('' to skip it)")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run to compare with')
+    parser.add_argument('--n-test', type=int, default=1000)
+    parser.add_argument('--matching-method', default='assignment')
+    parser.add_argument('--no-memory', action='store_true', help='only measure the wall time')
+    args = parser.parse_args()
+
+    results = run_benchmark_suite(args.sizes, args.data or None, args.output, n_test=args.n_test,
+                                  matching_method=args.matching_method, trace_memory=not args.no_memory)
+    print(results.to_string())
+    if args.compare:
+        print(compare_benchmarks(args.compare, args.output).to_string())
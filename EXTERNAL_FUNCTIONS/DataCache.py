@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+
+from EXTERNAL_FUNCTIONS import DataImport
+from EXTERNAL_FUNCTIONS import DatasetTreatment
+
+"""
+This file contains a columnar on-disk cache of the parsed (and treated) dataframes of the CMU corpus.
+An entry of the cache is rebuilt only when the mtime, the size or the content of its source file changed.
+"""
+
+CACHE_FOLDER = './DATA/Cache'
+
+# Extension of the cache files for each supported format
+CACHE_FORMATS = {'parquet': '.parquet', 'feather': '.feather', 'pickle': '.pkl'}
+# parquet and feather need pyarrow (or fastparquet), which is not in the requirements
+CACHE_FORMAT = 'pickle'
+
+# Columns of the treated movie dataframe containing lists (converted back to lists when read)
+LIST_COLUMNS = ['Freebase Language', 'Movie languages', 'Freebase country', 'Movie countries',
+                'Freebase genre', 'Movie genres']
+
+
+def file_hash(file, block_size=1 << 20):
+    """
+    Return the sha256 hash of the content of @file.
+    """
+    sha = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _source_signature(file, with_hash=True):
+    stat = os.stat(file)
+    signature = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    if with_hash:
+        signature['sha256'] = file_hash(file)
+    return signature
+
+
+def _write_frame(df, file, file_format):
+    tmp_file = file+'.tmp'
+    if file_format == 'parquet':
+        df.to_parquet(tmp_file, index=False)
+    elif file_format == 'feather':
+        df.reset_index(drop=True).to_feather(tmp_file)
+    else:
+        df.to_pickle(tmp_file)
+    os.replace(tmp_file, file)
+
+
+def _read_frame(file, file_format, list_columns=()):
+    if file_format == 'parquet':
+        df = pd.read_parquet(file)
+    elif file_format == 'feather':
+        df = pd.read_feather(file)
+    else:
+        df = pd.read_pickle(file)
+    # Arrow gives back list columns as arrays
+    for col in list_columns:
+        df[col] = [list(values) for values in df[col]]
+    return df
+
+
+def _schema_signature(dataset):
+    # The entries are rebuilt when the dtypes declared for their dataset change
+    return repr(DataImport.DATASET_SCHEMAS.get(dataset))
+
+
+def _build_entry(PATH, dataset, treated):
+    df = DataImport.OpenDatasetFile(PATH, dataset)
+    if dataset == 'movie' and treated:
+        df = DatasetTreatment.MovieDF_Treatment(df)
+    return df
+
+
+def load_entry(PATH, dataset, cache_folder=CACHE_FOLDER, treated=True, file_format=CACHE_FORMAT):
+    """
+    Return the dataframe of @dataset ('character', 'movie', 'name', 'plot' or 'tvtrop') from the cache
+    @cache_folder, rebuilding it from the file stored in @PATH if needed, and a dict of timings.
+
+    The source file is hashed only when its mtime or size differs from the ones stored in the cache:
+    if the content is unchanged the cache is kept (status 'revalidated'), otherwise it is rebuilt.
+    """
+    start = time.perf_counter()
+    source_file = os.path.join(PATH, DataImport.DATASET_FILES[dataset])
+    entry = dataset+'_treated' if (dataset == 'movie' and treated) else dataset
+    cache_file = os.path.join(cache_folder, entry+CACHE_FORMATS[file_format])
+    manifest_file = os.path.join(cache_folder, entry+'.json')
+
+    manifest = None
+    if os.path.exists(cache_file) and os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != file_format or manifest.get('schema') != _schema_signature(dataset):
+            manifest = None
+
+    status = 'rebuilt'
+    signature = _source_signature(source_file, with_hash=False)
+    if manifest is not None:
+        if all(manifest['source'][key] == signature[key] for key in signature):
+            status = 'hit'
+        else:
+            signature['sha256'] = file_hash(source_file)
+            if manifest['source']['sha256'] == signature['sha256']:
+                status = 'revalidated'
+
+    if status == 'rebuilt':
+        df = _build_entry(PATH, dataset, treated)
+        list_columns = [col for col in LIST_COLUMNS if col in df.columns and entry == 'movie_treated']
+        os.makedirs(cache_folder, exist_ok=True)
+        _write_frame(df, cache_file, file_format)
+        if 'sha256' not in signature:
+            signature['sha256'] = file_hash(source_file)
+        manifest = {'source': signature, 'format': file_format, 'list_columns': list_columns,
+                    'schema': _schema_signature(dataset)}
+    else:
+        df = _read_frame(cache_file, file_format, manifest['list_columns'])
+        manifest['source'] = {**manifest['source'], **signature}
+
+    if status != 'hit':
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f)
+
+    timings = {'dataset': dataset, 'status': status, 'seconds': time.perf_counter()-start}
+    return df, timings
+
+
+def OpenCachedMovieDatasetDF(PATH, cache_folder=CACHE_FOLDER, treated=True, file_format=CACHE_FORMAT,
+                             return_timings=False):
+    """
+    Cached equivalent of DataImport.OpenMainMovieDatasetDF (followed by DatasetTreatment.MovieDF_Treatment
+    if @treated). Return the character, movie, name, plot and tvtrop dataframes, and if @return_timings
+    a dataframe with the status ('hit', 'revalidated' or 'rebuilt') and the load time of each entry.
+    """
+    frames = []
+    timings = []
+    for dataset in DataImport.DATASET_FILES:
+        df, timing = load_entry(PATH, dataset, cache_folder, treated, file_format)
+        frames.append(df)
+        timings.append(timing)
+
+    if return_timings:
+        return (*frames, pd.DataFrame(timings))
+    return tuple(frames)
+
+
+def refresh_cache(PATH, cache_folder=CACHE_FOLDER, treated=True, file_format=CACHE_FORMAT):
+    """
+    Force the rebuild of every entry of the cache and return the time taken for each of them.
+    """
+    for dataset in DataImport.DATASET_FILES:
+        entry = dataset+'_treated' if (dataset == 'movie' and treated) else dataset
+        manifest_file = os.path.join(cache_folder, entry+'.json')
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+    return OpenCachedMovieDatasetDF(PATH, cache_folder, treated, file_format, return_timings=True)[-1]
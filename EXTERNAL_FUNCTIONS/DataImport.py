@@ -1,114 +1,324 @@
 import os
 import json
+import numpy as np
 import pandas as pd
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
-def OpenMainMovieDatasetDF(PATH):
+MOVIE_COL = ["Wikipedia movie ID", "Freebase movie ID", "Movie name", "Movie release date",
+             "Movie box office revenue", "Movie runtime", "Movie languages", "Movie countries",
+             "Movie genres"]
+
+CHARACTER_COL = ["Wikipedia movie ID", "Freebase movie ID", "Movie release date", "Character Name", "Actor DOB",
+                 "Actor gender", "Actor height", "Actor ethnicity", "Actor Name",
+                 "Actor age at movie release", "Freebase character map"]
+
+NAME_COL = ["Character Name", "Freebase character map"]
+
+PLOT_COL = ["Wikipedia movie ID", "Plot"]
+
+TVTROP_COL = ["stereotype", "char", "movie", "id", "actor"]
+
+# Name of the file of each dataset of the CMU corpus, in the order returned by OpenMainMovieDatasetDF
+DATASET_FILES = {'character': 'character.metadata.tsv',
+                 'movie': 'movie.metadata.tsv',
+                 'name': 'name.clusters.txt',
+                 'plot': 'plot_summaries.txt',
+                 'tvtrop': 'tvtropes.clusters.txt'}
+
+# Compact dtypes of the columns of the datasets ('datetime' columns are parsed as dates, invalid dates giving NaT)
+CHARACTER_SCHEMA = {"Wikipedia movie ID": "int32", "Freebase movie ID": "category", "Movie release date": "datetime",
+                    "Actor DOB": "datetime", "Actor gender": "category", "Actor height": "float32",
+                    "Actor ethnicity": "category", "Actor Name": "category", "Actor age at movie release": "Int8"}
+
+MOVIE_SCHEMA = {"Wikipedia movie ID": "int32", "Movie release date": "datetime", "Movie runtime": "float32"}
+
+DATASET_SCHEMAS = {'character': CHARACTER_SCHEMA, 'movie': MOVIE_SCHEMA}
+
+def ApplySchema(df, schema):
+    '''
+    Converts the columns of df to the dtypes of schema (dict column -> dtype), the values which can't be represented
+    (e.g. ages out of the Int8 range, which are errors of the dataset) becoming missing values
+    '''
+    df = df.copy()
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == "datetime":
+            df[column] = pd.to_datetime(df[column], format="ISO8601", errors="coerce")
+        elif dtype in ("Int8", "Int16", "Int32"):
+            info = np.iinfo(dtype.lower())
+            values = pd.to_numeric(df[column], errors="coerce").round()
+            df[column] = values.where(values.between(info.min, info.max)).astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def _read_dataset(file, dataset, **kwargs):
+    '''
+    Reads the tab separated file of the dataset ('character', 'movie', 'name' or 'plot'), kwargs being given to pandas
+    '''
+    if dataset == 'character':
+        return pd.read_table(file, names=CHARACTER_COL, index_col=False, **kwargs)
+    if dataset == 'movie':
+        return pd.read_table(file, names=MOVIE_COL, index_col=False, **kwargs)
+    if dataset == 'name':
+        return pd.read_csv(file, sep="\t", names=NAME_COL, index_col=False, **kwargs)
+    if dataset == 'plot':
+        return pd.read_csv(file, sep="\t", names=PLOT_COL, index_col=False, **kwargs)
+    raise ValueError(f"Unknown dataset {dataset}, expected one of {list(DATASET_FILES)}")
+
+def OpenDatasetFile(PATH, dataset, compact=True):
+    '''
+    This function opens the file of the given dataset ('character', 'movie', 'name', 'plot' or 'tvtrop')
+    stored in the folder with location PATH
+    If compact, the character and movie dataframes are loaded with the dtypes of their schema (see DATASET_SCHEMAS)
+    '''
+    file = os.path.join(PATH, DATASET_FILES[dataset])
+    if dataset == 'tvtrop':
+        return OpenTvTropDF(file)
+    df = _read_dataset(file, dataset)
+    return ApplySchema(df, DATASET_SCHEMAS[dataset]) if (compact and dataset in DATASET_SCHEMAS) else df
+
+def OpenMainMovieDatasetDF(PATH, compact=True):
     '''
     This function opens the dataframes stored in the file with location PATH
     '''
-    character_file = os.path.join(PATH, 'character.metadata.tsv')
-    movie_file = os.path.join(PATH, 'movie.metadata.tsv')
-    name_file = os.path.join(PATH, 'name.clusters.txt')
-    plot_file = os.path.join(PATH, 'plot_summaries.txt')
-    tvtrop_file = os.path.join(PATH, 'tvtropes.clusters.txt')
+    characterDF, movieDF, nameDF, plotDF, tvtropDF = [OpenDatasetFile(PATH, dataset, compact) for dataset in DATASET_FILES]
+
+    return characterDF, movieDF, nameDF, plotDF, tvtropDF
 
-    movie_col = ["Wikipedia movie ID", "Freebase movie ID", "Movie name", "Movie release date",
-                  "Movie box office revenue", "Movie runtime", "Movie languages", "Movie countries",
-                  "Movie genres"]
+# Column on which each row predicate of the streaming API is applied
+PREDICATE_COLUMNS = {'movie_ids': "Wikipedia movie ID", 'years': "Movie release date", 'genders': "Actor gender"}
 
-    character_col = ["Wikipedia movie ID", "Freebase movie ID", "Movie release date", "Character Name", "Actor DOB",
-                     "Actor gender", "Actor height", "Actor ethnicity", "Actor Name",
-                     "Actor age at movie release", "Freebase character map"]
-    name_col = ["Character Name", "Freebase character map"]
+def _filter_chunk(chunk, movie_ids=None, years=None, genders=None):
+    '''
+    Keeps the rows of the raw chunk whose movie id is in movie_ids, release year between years = (first_year, last_year)
+    (included) and actor gender in genders (the predicates which are None are not applied)
+    '''
+    keep = np.ones(len(chunk), dtype=bool)
+    if movie_ids is not None:
+        keep &= chunk[PREDICATE_COLUMNS['movie_ids']].isin(movie_ids).to_numpy()
+    if years is not None:
+        year = pd.to_numeric(chunk[PREDICATE_COLUMNS['years']].astype(str).str[:4], errors="coerce")
+        keep &= year.between(years[0], years[1]).to_numpy()
+    if genders is not None:
+        keep &= chunk[PREDICATE_COLUMNS['genders']].isin(genders).to_numpy()
+    return chunk[keep]
 
-    plot_col = ["Wikipedia movie ID", "Plot"]
+def IterDatasetChunks(PATH, dataset, chunksize=100000, columns=None, movie_ids=None, years=None, genders=None, compact=True):
+    '''
+    Streams the file of the dataset stored in PATH and yields dataframes of at most chunksize rows (before filtering),
+    so that the memory used does not depend on the size of the file.
+    Only the columns are kept (all by default) and only the rows verifying the predicates on the movie id (movie_ids),
+    the release year (years = (first_year, last_year)) and the actor gender (genders) are kept, while reading each chunk.
+    If compact, the schema of the dataset is applied to each chunk (the categories then differ between chunks)
+    '''
+    predicates = {'movie_ids': movie_ids, 'years': years, 'genders': genders}
+    predicates = {key: value for key, value in predicates.items() if value is not None}
+    if 'movie_ids' in predicates:
+        predicates['movie_ids'] = set(predicates['movie_ids'])
+    file = os.path.join(PATH, DATASET_FILES[dataset])
+
+    if dataset == 'tvtrop':
+        if predicates:
+            raise ValueError("The tvtropes dataset can't be filtered on " + str(list(predicates)))
+        chunks = IterTvTropChunks(file, chunksize)
+        all_columns = TVTROP_COL
+    else:
+        all_columns = {'character': CHARACTER_COL, 'movie': MOVIE_COL, 'name': NAME_COL, 'plot': PLOT_COL}[dataset]
+        missing = [key for key in predicates if PREDICATE_COLUMNS[key] not in all_columns]
+        if missing:
+            raise ValueError(f"The {dataset} dataset can't be filtered on {missing}")
+        # Only the projected columns and the ones of the predicates are parsed
+        needed = set(all_columns if columns is None else columns) | {PREDICATE_COLUMNS[key] for key in predicates}
+        chunks = _read_dataset(file, dataset, usecols=[col for col in all_columns if col in needed], chunksize=chunksize)
+
+    columns = all_columns if columns is None else columns
+    for chunk in chunks:
+        chunk = _filter_chunk(chunk, **predicates)[[col for col in columns if col in chunk.columns]]
+        if compact and dataset in DATASET_SCHEMAS:
+            chunk = ApplySchema(chunk, DATASET_SCHEMAS[dataset])
+        yield chunk
+
+def OpenFilteredDatasetDF(PATH, dataset, chunksize=100000, columns=None, movie_ids=None, years=None, genders=None, compact=True):
+    '''
+    Opens only the columns and the rows of the dataset verifying the predicates (see IterDatasetChunks), in a memory bounded
+    by the size of the result and chunksize, e.g. the characters of a pool of movies without loading the whole character metadata
+    '''
+    chunks = list(IterDatasetChunks(PATH, dataset, chunksize, columns, movie_ids, years, genders, compact=False))
+    df = pd.concat(chunks, ignore_index=True)
+    return ApplySchema(df, DATASET_SCHEMAS[dataset]) if (compact and dataset in DATASET_SCHEMAS) else df
+
+def MemoryFootprint(PATH, datasets=('character', 'movie')):
+    '''
+    Returns the memory used by each of the datasets stored in PATH when loaded with the default dtypes and with their schema (in MB)
+    '''
+    footprint = []
+    for dataset in datasets:
+        default_MB = OpenDatasetFile(PATH, dataset, compact=False).memory_usage(deep=True).sum()/1e6
+        compact_MB = OpenDatasetFile(PATH, dataset, compact=True).memory_usage(deep=True).sum()/1e6
+        footprint.append({'dataset': dataset, 'default_MB': default_MB, 'compact_MB': compact_MB,
+                          'ratio': compact_MB/default_MB})
+    return pd.DataFrame(footprint)
 
-    characterDF = pd.read_table(character_file, names=character_col, index_col=False)
-    movieDF = pd.read_table(movie_file, names=movie_col, index_col=False)
-    nameDF = pd.read_csv(name_file, sep="\t", names=name_col, index_col=False)
-    plotDF = pd.read_csv(plot_file, sep="\t", names=plot_col, index_col=False)
+def _count_lines(file, block_size=1 << 20):
+    '''
+    Counts the number of lines of the file by reading it by blocks of bytes
+    '''
+    n_lines = 0
+    last_block = b""
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            n_lines += block.count(b"\n")
+            last_block = block
+    # Last line without a trailing newline
+    if last_block and not last_block.endswith(b"\n"):
+        n_lines += 1
+    return n_lines
 
-    tvtrop_f = open(tvtrop_file)
-    lines = tvtrop_f.readlines()
-    tvtrop_f.close()
-    tvtropDF = pd.DataFrame(columns=["stereotype", "char", "movie", "id", "actor"])
+def _parse_tvtrop_lines(lines, n_lines):
+    '''
+    Parses n_lines lines of the tvtropes file into preallocated column buffers
+    and builds the dataframe once
+    '''
+    buffers = {col: np.empty(n_lines, dtype=object) for col in TVTROP_COL}
+    n = 0
     for line in lines:
-        char_type, dico = line.split("\t")
+        if not line.strip():
+            continue
+        char_type, dico = line.rstrip("\n").split("\t", 1)
         dico = json.loads(dico)
-        dico["stereotype"] = char_type
-        tvtropDF = pd.concat([tvtropDF, pd.DataFrame([dico])], ignore_index=True)
+        buffers["stereotype"][n] = char_type
+        for col in TVTROP_COL[1:]:
+            buffers[col][n] = dico.get(col)
+        n += 1
+    return pd.DataFrame({col: buffer[:n] for col, buffer in buffers.items()}, columns=TVTROP_COL)
 
-    return characterDF, movieDF, nameDF, plotDF, tvtropDF
+def IterTvTropChunks(tvtrop_file, chunksize=100000):
+    '''
+    Streams the tvtropes file (one "stereotype\t{json}" record per line) and yields
+    dataframes of at most chunksize rows, so that files bigger than the memory can be processed
+    '''
+    with open(tvtrop_file, encoding="utf-8") as f:
+        while True:
+            lines = list(islice(f, chunksize))
+            if not lines:
+                break
+            yield _parse_tvtrop_lines(lines, len(lines))
 
-def OpenBabyNameDf(PATH):
+def OpenTvTropDF(tvtrop_file, chunksize=None):
     '''
-    This function opens the dataframes stored in the file with location PATH
+    Opens the tvtropes file in linear time.
+    If chunksize is given, returns an iterator of dataframes of at most chunksize rows instead
     '''
-    
-    #for all file present in the folder
-    files = os.listdir(PATH)
-    baby_nameDF = pd.DataFrame()
-    
-    for file in files:
-        if file.endswith(".txt"):
-            name_file = os.path.join(PATH, file)
-            # name_col = ["Firstname","Sexe","Number"]
-            name_a_yearDF = pd.read_table(name_file, sep=",",index_col=False)
-            name_a_yearDF = name_a_yearDF.drop_duplicates()
-            name_a_yearDF = name_a_yearDF.drop(name_a_yearDF[name_a_yearDF["Firstname"]=="Firstname"].index)
-            #add a column for the year given in the filename
-            name_a_yearDF["Year"] = file.split(".")[0].replace("yob","")
-            name_a_yearDF.to_csv(os.path.join(PATH, file),index=False)
-            
-            # Concatenate the new data with the existing data
-            baby_nameDF = pd.concat([baby_nameDF, name_a_yearDF])
-        
-    return baby_nameDF
+    if chunksize is not None:
+        return IterTvTropChunks(tvtrop_file, chunksize)
 
-def FillMissingValues(target_df, source_df, target_column, source_column, id):
-    # Calculate percentage of missing values before filling
-    before_fill_percentage = target_df[target_column].isnull().mean() * 100
-    
-    temporary = pd.merge(target_df,source_df,on = id, how='left',suffixes=('_target', '_source'))
+    n_lines = _count_lines(tvtrop_file)
+    with open(tvtrop_file, encoding="utf-8") as f:
+        tvtropDF = _parse_tvtrop_lines(f, n_lines)
+    return tvtropDF
 
-    # Replace the Nan of the target dataframe if a Value can be found for the same movie in the source dataframe
-    target_df[target_column] = target_df[target_column].fillna(temporary[source_column+'_source'])
+BABY_NAME_COL = ["Firstname", "Sexe", "Number"]
 
-    # Calculate percentage of missing values after filling
-    after_fill_percentage = target_df[target_column].isnull().mean() * 100
+def _read_baby_name_file(name_file, year):
+    '''
+    Reads one yobYYYY.txt file without modifying it. The raw SSA files have no header
+    while the ones rewritten by the former loader have a header and a Year column
+    '''
+    with open(name_file) as f:
+        has_header = f.readline().startswith("Firstname")
+    name_a_yearDF = pd.read_csv(name_file, header=0 if has_header else None, names=BABY_NAME_COL,
+                                usecols=[0, 1, 2], dtype={"Firstname": str, "Sexe": str})
+    # Drop the header lines repeated inside the file, if any
+    if name_a_yearDF["Number"].dtype == object:
+        name_a_yearDF = name_a_yearDF[name_a_yearDF["Firstname"] != "Firstname"]
+        name_a_yearDF["Number"] = pd.to_numeric(name_a_yearDF["Number"])
+    name_a_yearDF = name_a_yearDF.drop_duplicates()
+    name_a_yearDF["Year"] = year
+    return name_a_yearDF
 
-    # Calculate the percentage improvement
-    improvement_percentage = before_fill_percentage - after_fill_percentage
+def OpenBabyNameDf(PATH, years=None, n_workers=8):
+    '''
+    This function opens the dataframes stored in the file with location PATH.
+    The yearly files are read concurrently by n_workers threads and are never rewritten.
+    If years = (first_year, last_year) is given, only the files of these years (included) are opened.
+    Returns a single dataframe with categorical Firstname and Sexe, uint32 Number and int16 Year
+    '''
+    year_files = {}
+    for file in sorted(os.listdir(PATH)):
+        if file.startswith("yob") and file.endswith(".txt"):
+            year = int(file[3:-4])
+            if years is None or years[0] <= year <= years[1]:
+                year_files[year] = os.path.join(PATH, file)
 
-    # Print the results
-    print(f"Percentage of missing values before fill : {before_fill_percentage:.2f}%")
-    print(f"Percentage of missing values after fill: {after_fill_percentage:.2f}%")
-    print(f"Percentage improvement: {improvement_percentage:.2f}%")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        frames = list(executor.map(_read_baby_name_file, year_files.values(), year_files.keys()))
 
-    return target_df
+    if not frames:
+        frames = [pd.DataFrame(columns=BABY_NAME_COL+["Year"])]
+    # A single concatenation, then the compact dtypes
+    baby_nameDF = pd.concat(frames, ignore_index=True)
+    baby_nameDF = baby_nameDF.astype({"Firstname": "category", "Sexe": "category",
+                                      "Number": np.uint32, "Year": np.int16})
+    return baby_nameDF
 
+def BuildKeyIndex(source_df, id, columns):
+    '''
+    Builds once the index key -> value of the columns of source_df, id being the key column (or list of key columns).
+    Each key is kept once, with the first non missing value of each column (only the keys present in source_df, even for categorical keys)
+    '''
+    return source_df.groupby(id, sort=False, observed=True, dropna=True)[list(columns)].first()
 
-def OpenBabyNameDf(PATH) :
+def FillMissingColumns(target_df, source_df, columns, id, key_index=None):
     '''
-    This function opens the dataframes stored in the file with location PATH
+    Fills the missing values of several columns of target_df, in place, with the values found for the same key (id) in source_df.
+    columns is a dict target column -> source column (or a list of columns with the same name in both dataframes).
+    The values are looked up in the index built by BuildKeyIndex (built once for all the columns if key_index is not given).
+    Returns target_df and a dataframe of the fill statistics (one row per column)
     '''
-    
-    #for all file present in the folder
-    files = os.listdir(PATH)
-    baby_nameDF = pd.DataFrame()
-    
-    for file in files:
-        if file.endswith(".txt"):
-            name_file = os.path.join(PATH, file)
-            # name_col = ["Firstname","Sexe","Number"]
-            name_a_yearDF = pd.read_table(name_file, sep=",",index_col=False)
-            name_a_yearDF = name_a_yearDF.drop_duplicates()
-            name_a_yearDF = name_a_yearDF.drop(name_a_yearDF[name_a_yearDF["Firstname"]=="Firstname"].index)
-            #add a column for the year given in the filename
-            name_a_yearDF["Year"] = file.split(".")[0].replace("yob","")
-            name_a_yearDF.to_csv(os.path.join(PATH, file),index=False)
-            
-            # Concatenate the new data with the existing data
-            baby_nameDF = pd.concat([baby_nameDF, name_a_yearDF])
-        
-    return baby_nameDF
\ No newline at end of file
+    if not isinstance(columns, dict):
+        columns = {column: column for column in columns}
+    if isinstance(id, list) and len(id) == 1:
+        id = id[0]
+    if key_index is None:
+        key_index = BuildKeyIndex(source_df, id, columns.values())
+
+    keys = pd.MultiIndex.from_frame(target_df[id]) if isinstance(id, list) else pd.Index(target_df[id])
+    positions = key_index.index.get_indexer(keys)
+
+    stats = []
+    for target_column, source_column in columns.items():
+        missing_before = int(target_df[target_column].isnull().sum())
+        values = pd.Series(pd.api.extensions.take(key_index[source_column].values, positions, allow_fill=True), index=target_df.index)
+        if isinstance(target_df[target_column].dtype, pd.CategoricalDtype):
+            # The values filled in a categorical column (e.g. of the compact schema) must be categories first
+            target = target_df[target_column]
+            new_categories = pd.Index(values[target.isnull()].dropna().unique()).difference(target.cat.categories)
+            target_df[target_column] = target.cat.add_categories(new_categories)
+            values = values.astype(object)
+        target_df[target_column] = target_df[target_column].fillna(values)
+        missing_after = int(target_df[target_column].isnull().sum())
+        stats.append({'column': target_column, 'source_column': source_column, 'missing_before': missing_before,
+                      'filled': missing_before - missing_after, 'missing_after': missing_after,
+                      'before_fill_percentage': missing_before/max(len(target_df), 1)*100,
+                      'after_fill_percentage': missing_after/max(len(target_df), 1)*100})
+    stats = pd.DataFrame(stats)
+    stats['improvement_percentage'] = stats['before_fill_percentage'] - stats['after_fill_percentage']
+    return target_df, stats
+
+def FillMissingValues(target_df, source_df, target_column, source_column, id):
+    '''
+    Fills the missing values of target_column of target_df with the values of source_column of source_df for the same key id,
+    and prints the percentage of missing values before and after (see FillMissingColumns to fill several columns at once)
+    '''
+    target_df, stats = FillMissingColumns(target_df, source_df, {target_column: source_column}, id)
+    stats = stats.iloc[0]
+
+    # Print the results
+    print(f"Percentage of missing values before fill : {stats['before_fill_percentage']:.2f}%")
+    print(f"Percentage of missing values after fill: {stats['after_fill_percentage']:.2f}%")
+    print(f"Percentage improvement: {stats['improvement_percentage']:.2f}%")
+
+    return target_df
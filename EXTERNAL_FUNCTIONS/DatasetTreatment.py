@@ -1,5 +1,13 @@
-import pandas as pd
+import re
 import ast
+import json
+import numpy as np
+import pandas as pd
+
+# Matches either a row separator or one '"key": "value"' pair of a Freebase dictionnary
+FREEBASE_PAIR_RE = re.compile(r'(\n)|"((?:[^"\\]|\\.)*)"[ \t]*:[ \t]*"((?:[^"\\]|\\.)*)"')
+# Matches either a row separator or one quoted string (key or value), to count the entries of each row
+FREEBASE_STRING_RE = re.compile(r'(\n)|"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
 
 def split_dict(row):
     '''
@@ -11,22 +19,77 @@ def split_dict(row):
         keys, values = zip(*row.items())
     return pd.Series({'Keys': list(keys), 'Values': list(values)})
 
+def _unescape(string):
+    '''
+    Decodes the escaped characters of a string taken from a Freebase dictionnary (e.g. \\u00e9)
+    '''
+    if '\\' in string:
+        return json.loads('"'+string+'"')
+    return string
+
+def decode_freebase_column(column):
+    '''
+    This function parses in bulk a column of Freebase dictionnaries ('{"/m/..": "Name", ...}') :
+    all the rows are joined in a single text scanned once by a regular expression.
+    The rows in which the number of '"key": "value"' pairs found differs from the number of quoted strings divided by two
+    (other quotes, unexpected formats) are parsed with ast.literal_eval instead.
+    It returns a long dataframe with one line per (row, key) pair, where 'row' is the position of the row in the column,
+    and the mapping between the categorical 'code' and the Freebase 'Key' and 'Value'
+    '''
+    strings = column.fillna('{}').astype(str)
+    text = '\n'.join(strings)
+    matches = np.array(FREEBASE_PAIR_RE.findall(text), dtype=object).reshape(-1, 3)
+    is_separator = matches[:, 0] == '\n'
+    rows = np.cumsum(is_separator)[~is_separator]
+    pairs = matches[~is_separator]
+
+    codes, uniques = pd.factorize(pd.Series(pairs[:, 1], dtype=object) + '\t' + pd.Series(pairs[:, 2], dtype=object))
+    # Only the distinct pairs have to be split and unescaped
+    split_uniques = [pair.split('\t', 1) for pair in uniques]
+    mapping = pd.DataFrame({'Key': [_unescape(key) for key, _ in split_uniques],
+                            'Value': [_unescape(value) for _, value in split_uniques]})
+
+    # Each row is followed by one separator, except the last one
+    tokens = np.array(FREEBASE_STRING_RE.findall(text), dtype=object)
+    is_token_separator = tokens == '\n'
+    n_entries = np.bincount(np.cumsum(is_token_separator)[~is_token_separator], minlength=len(strings))/2
+    fallback = np.flatnonzero(np.bincount(rows, minlength=len(strings)) != n_entries)
+    if len(fallback):
+        parsed = [(row, str(key), str(value)) for row in fallback for key, value in ast.literal_eval(strings.iloc[row]).items()]
+        rows = np.concatenate([rows, np.array([row for row, _, _ in parsed], dtype=np.int64)])
+        keys = np.concatenate([mapping['Key'].values[codes], np.array([key for _, key, _ in parsed], dtype=object)])
+        values = np.concatenate([mapping['Value'].values[codes], np.array([value for _, _, value in parsed], dtype=object)])
+        order = np.argsort(rows, kind='stable')
+        rows = rows[order]
+        codes, uniques = pd.MultiIndex.from_arrays([keys[order], values[order]]).factorize()
+        mapping = pd.DataFrame({'Key': uniques.get_level_values(0), 'Value': uniques.get_level_values(1)})
+    mapping.index.name = 'code'
+
+    long = pd.DataFrame({'row': rows.astype(np.int64), 'code': codes.astype(np.int32)})
+    return long, mapping
+
+def freebase_to_lists(long, mapping, n_rows):
+    '''
+    Converts the output of decode_freebase_column back to a dataframe with the 'Keys' and 'Values' list columns
+    given by split_dict, for the n_rows rows of the original column
+    '''
+    bounds = np.cumsum(np.bincount(long['row'], minlength=n_rows))[:-1]
+    keys = np.split(mapping['Key'].values[long['code']], bounds)
+    values = np.split(mapping['Value'].values[long['code']], bounds)
+    return pd.DataFrame({'Keys': [list(k) for k in keys], 'Values': [list(v) for v in values]})
+
 def MovieDF_Treatment(MovieDF) :
     '''
     This function deals with the dataframe MovieDF
     '''
     df = MovieDF.copy(deep = True)
-    #Movie languages 
-    df['Movie languages'] = df['Movie languages'].apply(ast.literal_eval)
-    df[['Freebase Language', 'Movie languages']] = df['Movie languages'].apply(split_dict)
-    
-    #Movie countrty 
-    df['Movie countries'] = df['Movie countries'].apply(ast.literal_eval)
-    df[['Freebase country', 'Movie countries']] = df['Movie countries'].apply(split_dict)
-    #Movie genres 
-    
-    df['Movie genres'] = df['Movie genres'].apply(ast.literal_eval)
-    df[['Freebase genre', 'Movie genres']] = df['Movie genres'].apply(split_dict)
+    for column, freebase_column in [('Movie languages', 'Freebase Language'),
+                                    ('Movie countries', 'Freebase country'),
+                                    ('Movie genres', 'Freebase genre')]:
+        long, mapping = decode_freebase_column(df[column])
+        lists = freebase_to_lists(long, mapping, len(df))
+        df[freebase_column] = lists['Keys'].values
+        df[column] = lists['Values'].values
     return df
 
 def extract_top_firstname(name, valid_firstnames, name_occurrences_dict):
@@ -36,4 +99,50 @@ def extract_top_firstname(name, valid_firstnames, name_occurrences_dict):
         if firstnames:
             top_firstname = max(firstnames, key=lambda n: name_occurrences_dict.get(n, 0))
             return top_firstname
-    return None
\ No newline at end of file
+    return None
+
+def build_firstname_vocabulary(valid_firstnames, name_occurrences_dict):
+    '''
+    Builds the vocabulary used by extract_top_firstname_batch : the index of the valid firstnames
+    and the array of their number of occurrences (0 if absent from name_occurrences_dict)
+    '''
+    vocabulary = pd.Index(sorted(valid_firstnames))
+    occurrences = np.array([name_occurrences_dict.get(n, 0) for n in vocabulary], dtype=np.float64)
+    return vocabulary, occurrences
+
+def extract_top_firstname_batch(names, valid_firstnames=None, name_occurrences_dict=None, vocabulary=None):
+    '''
+    Vectorized version of extract_top_firstname for a whole column of names (e.g. characterDF["Actor Name"]) :
+    the names are tokenized at once, the tokens mapped to the ids of the vocabulary and the most frequent
+    valid token of each row is kept (the first one in case of tie, as max does).
+    The vocabulary given by build_firstname_vocabulary can be passed to avoid rebuilding it.
+    Returns a series with the same index as names (None when no valid firstname is found)
+    '''
+    if vocabulary is None:
+        vocabulary = build_firstname_vocabulary(valid_firstnames, name_occurrences_dict)
+    vocabulary_index, occurrences = vocabulary
+
+    names = pd.Series(names)
+    # Each distinct name is only processed once
+    codes, unique_names = pd.factorize(names)
+    split_names = pd.Series(unique_names, dtype=object).str.split()
+    # Empty names and non string values give no token
+    tokens = split_names.explode().dropna().to_numpy()
+    rows = np.repeat(np.arange(len(unique_names)), split_names.str.len().fillna(0).astype(int).to_numpy())
+
+    token_ids = vocabulary_index.get_indexer(tokens)
+    valid = token_ids >= 0
+    rows, token_ids = rows[valid], token_ids[valid]
+    positions = np.arange(len(rows))
+
+    # For each row, the token with the highest occurrence and then the lowest position comes first
+    order = np.lexsort((positions, -occurrences[token_ids], rows))
+    rows, token_ids = rows[order], token_ids[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+
+    top_unique = np.full(len(unique_names)+1, None, dtype=object)
+    top_unique[rows[first]] = vocabulary_index.to_numpy()[token_ids[first]]
+    # The code -1 of the missing names points to the last None
+    top_firstname = top_unique[codes]
+    return pd.Series(top_firstname, index=names.index)
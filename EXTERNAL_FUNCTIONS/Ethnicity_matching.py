@@ -1,44 +1,175 @@
-import pandas as pd
-import numpy as np
 import os
-import json
-import ast
-import math 
-import time 
+import sqlite3
+import argparse
 import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from EXTERNAL_FUNCTIONS import DataImport
+
+#This file resolves freebase ids (ethnicities, languages, countries, genres) to their english name with the Wikidata SPARQL endpoint
+#The ids are sent by batches in VALUES queries, the names are kept in a sqlite cache and DATA/Ethnicities.csv is used when offline
+#Run it from the root of the repository (python -m EXTERNAL_FUNCTIONS.Ethnicity_matching) to generate the csv which matches freebase id of ethnicities to the actual english name
+
+WIKIDATA_ENDPOINT = "https://query.wikidata.org/sparql"
+LABEL_CACHE_FILE = './DATA/Cache/freebase_labels.sqlite'
+ETHNICITY_FILE = './DATA/Ethnicities.csv'
+BATCH_SIZE = 200
+N_WORKERS = 4
+TIMEOUT = 60
+
+
+def open_label_cache(cache_file=LABEL_CACHE_FILE):
+    '''
+    Opens (and creates if needed) the sqlite cache of the names of the freebase ids
+    '''
+    if os.path.dirname(cache_file):
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    connection = sqlite3.connect(cache_file)
+    connection.execute("CREATE TABLE IF NOT EXISTS labels (freebase_id TEXT PRIMARY KEY, label TEXT NOT NULL)")
+    return connection
+
+def cached_labels(connection, ids):
+    '''
+    Returns the dict freebase id -> name of the ids already in the cache
+    '''
+    labels = {}
+    ids = list(ids)
+    for first in range(0, len(ids), 500):
+        batch = ids[first:first+500]
+        rows = connection.execute("SELECT freebase_id, label FROM labels WHERE freebase_id IN (" + ",".join("?"*len(batch)) + ")", batch)
+        labels.update(rows.fetchall())
+    return labels
+
+def store_labels(connection, labels):
+    '''
+    Stores the dict freebase id -> name labels in the cache
+    '''
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?)", labels.items())
+
+def build_query(ids):
+    '''
+    SPARQL query giving the english name of each of the freebase ids
+    '''
+    values = " ".join('"' + str(key) + '"' for key in ids)
+    return """SELECT ?id ?sLabel WHERE {
+                    VALUES ?id {""" + values + """}
+                    ?s wdt:P646 ?id .
+                        SERVICE wikibase:label {bd:serviceParam wikibase:language "en" .}
+                        }
+    """
+
+def query_batch(ids, endpoint=WIKIDATA_ENDPOINT, timeout=TIMEOUT):
+    '''
+    Sends one query for the batch of freebase ids and returns the dict freebase id -> name ('' if the query didn't give any result)
+    Raises requests.RequestException (or ValueError for an invalid answer) if the endpoint can't be reached
+    '''
+    r = requests.post(endpoint, params={'format': 'json'}, data={'query': build_query(ids)}, timeout=timeout)
+    r.raise_for_status()
+    labels = dict.fromkeys(ids, '')
+    for binding in r.json()['results']['bindings']:
+        if binding['id']['value'] in labels and not labels[binding['id']['value']]:
+            labels[binding['id']['value']] = binding['sLabel']['value']
+    return labels
+
+def fallback_labels(fallback_file=ETHNICITY_FILE):
+    '''
+    Returns the dict freebase id -> name of the csv generated by this file (used when the endpoint can't be reached)
+    '''
+    if fallback_file is None or not os.path.exists(fallback_file):
+        return {}
+    fallback = pd.read_csv(fallback_file, dtype=str).fillna('')
+    return dict(zip(fallback.iloc[:, 0], fallback.iloc[:, 1]))
+
+def resolve_freebase_ids(ids, endpoint=WIKIDATA_ENDPOINT, cache_file=LABEL_CACHE_FILE, batch_size=BATCH_SIZE,
+                         n_workers=N_WORKERS, fallback_file=ETHNICITY_FILE, timeout=TIMEOUT, verbose=True):
+    '''
+    Returns the dict freebase id -> english name ('' if unknown) of the ids (missing values are ignored)
+    The ids which are not in the cache are sent by batches of batch_size to the endpoint, with n_workers queries at a time,
+    and the names found are added to the cache. The ids of the batches which fail are looked for in fallback_file
+    '''
+    ids = [key for key in pd.unique(pd.Series(list(ids), dtype=object).dropna()) if key != '']
+    connection = open_label_cache(cache_file)
+    try:
+        labels = cached_labels(connection, ids)
+        missing = [key for key in ids if key not in labels]
+        batches = [missing[first:first+batch_size] for first in range(0, len(missing), batch_size)]
+
+        def run(batch):
+            try:
+                return batch, query_batch(batch, endpoint, timeout)
+            except (requests.RequestException, ValueError, KeyError) as error:
+                return batch, error
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for batch, result in executor.map(run, batches):
+                if isinstance(result, Exception):
+                    failed.extend(batch)
+                    if verbose:
+                        print('Query of ' + str(len(batch)) + ' ids failed : ' + str(result))
+                else:
+                    store_labels(connection, result)
+                    labels.update(result)
+    finally:
+        connection.close()
+
+    if failed:
+        fallback = fallback_labels(fallback_file)
+        labels.update({key: fallback.get(key, '') for key in failed})
+    return labels
+
+def seed_movie_labels(movieDF, cache_file=LABEL_CACHE_FILE):
+    '''
+    Adds to the cache the names of the languages, countries and genres given by the dataset itself, from the dataframe returned
+    by DatasetTreatment.MovieDF_Treatment, so that they are resolved without any query
+    '''
+    labels = {}
+    for key_column, value_column in [('Freebase Language', 'Movie languages'), ('Freebase country', 'Movie countries'),
+                                     ('Freebase genre', 'Movie genres')]:
+        pairs = pd.DataFrame({'key': movieDF[key_column].explode(), 'value': movieDF[value_column].explode()}).dropna()
+        labels.update(zip(pairs['key'], pairs['value']))
+    connection = open_label_cache(cache_file)
+    try:
+        store_labels(connection, labels)
+    finally:
+        connection.close()
+    return labels
+
+def resolve_movie_labels(movieDF, **kwargs):
+    '''
+    Resolves the language, country and genre ids of the dataframe returned by DatasetTreatment.MovieDF_Treatment
+    (the names given by the dataset are seeded in the cache first)
+    Returns a dataframe with the columns 'Freebase ID', 'Label' and 'Kind'
+    '''
+    seed_movie_labels(movieDF, kwargs.get('cache_file', LABEL_CACHE_FILE))
+    tables = []
+    for kind, key_column in [('language', 'Freebase Language'), ('country', 'Freebase country'), ('genre', 'Freebase genre')]:
+        ids = movieDF[key_column].explode().dropna().unique()
+        labels = resolve_freebase_ids(ids, **kwargs)
+        tables.append(pd.DataFrame({'Freebase ID': ids, 'Label': [labels.get(key, '') for key in ids], 'Kind': kind}))
+    return pd.concat(tables, ignore_index=True)
+
+def ethnicity_table(characterDF, **kwargs):
+    '''
+    Returns the dataframe matching each freebase id of characterDF['Actor ethnicity'] to its english name,
+    with the columns of DATA/Ethnicities.csv
+    '''
+    unique_ethnics = characterDF[['Actor ethnicity']].dropna().drop_duplicates()
+    labels = resolve_freebase_ids(unique_ethnics['Actor ethnicity'], **kwargs)
+    unique_ethnics['Ethnicity'] = unique_ethnics['Actor ethnicity'].map(labels)
+    return unique_ethnics
+
 
-#This file is used to generate a csv which matches freebase id of ethnicities to the actual english name 
-characterDF,movieDF,nameDF,plotDF,tvtropDF = DataImport.OpenMainMovieDatasetDF(PATH_IN)
-
-def FreeBase(key):
-    '''
-    The functions looks on the Wikidata freebase and gives the name of the page corresponding to the key provided 
-    '''
-    time.sleep(1) #Avoid the timeout errors 
-    try :
-        if isinstance(key,float) : 
-            return ''
-        key = "'"+str(key)+"'"
-        url = "https://query.wikidata.org/sparql"
-        query = """SELECT  ?sLabel WHERE {
-                        VALUES ?id {"""+key+"""} 
-                        ?s wdt:P646 ?id .
-                            SERVICE wikibase:label {bd:serviceParam wikibase:language "en" .}
-                            }
-        """
-        r = requests.post(url, params = { 'format': 'json','query': query})
-        r = r.json()
-        if len(r['results']['bindings'])==0 : 
-            # The query didn't give any results
-            return '' 
-        else : 
-            return r['results']['bindings'][0]['sLabel']['value']
-    except : 
-        print('ERROR')
-        print(r)
-        print(key)
-
-Unique_ethnics = characterDF[['Actor ethnicity']].dropna().drop_duplicates()
-Unique_ethnics['ethinicty (en)'] = Unique_ethnics['Actor ethnicity'].apply(FreeBase)
-Unique_ethnics.to_csv('ethnicity.csv',index = False)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Match the freebase ids of the ethnicities to their english name')
+    parser.add_argument('--path', default='./DATA/MovieSummaries', help='folder of the CMU movie summary corpus')
+    parser.add_argument('--output', default=ETHNICITY_FILE)
+    parser.add_argument('--endpoint', default=WIKIDATA_ENDPOINT)
+    parser.add_argument('--cache', default=LABEL_CACHE_FILE)
+    args = parser.parse_args()
 
+    characterDF = DataImport.OpenDatasetFile(args.path, 'character')
+    ethnicities = ethnicity_table(characterDF, endpoint=args.endpoint, cache_file=args.cache)
+    ethnicities.to_csv(args.output, index=False)
@@ -0,0 +1,204 @@
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+
+from EXTERNAL_FUNCTIONS import PoolStatistics
+from EXTERNAL_FUNCTIONS.ScoringRelatedFunctions import N_TEST, POOL_SIZE, weights_dic, plot_scores_distribution
+
+"""
+This file contains a batched Monte-Carlo engine equivalent to ScoringRelatedFunctions.scores_distribution:
+the random pools are drawn as a matrix of movie positions and scored by batches from the per-movie
+statistics of PoolStatistics.
+"""
+
+MEMORY_BUDGET = 256*2**20  # bytes used by the statistics of a batch of pools
+CHUNK_SIZE = 10000  # pools drawn from each random stream of the multi-core mode
+
+
+def sample_pools(n_movies, n_pools, pool_size, rng):
+    """
+    Draw @n_pools pools of @pool_size distinct movie positions among @n_movies.
+    """
+    if pool_size > n_movies:
+        raise ValueError(f"Cannot draw pools of {pool_size} movies among {n_movies}")
+    if pool_size > n_movies//4:
+        return rng.random((n_pools, n_movies)).argsort(axis=1)[:, :pool_size]
+
+    pools = rng.integers(0, n_movies, size=(n_pools, pool_size))
+    # Draw again the pools containing twice the same movie
+    while True:
+        sorted_pools = np.sort(pools, axis=1)
+        repeated = (sorted_pools[:, 1:] == sorted_pools[:, :-1]).any(axis=1)
+        if not repeated.any():
+            return pools
+        pools[repeated] = rng.integers(0, n_movies, size=(repeated.sum(), pool_size))
+
+
+def batch_size(stats, pool_size, memory_budget=MEMORY_BUDGET):
+    """
+    Number of pools whose statistics fit in @memory_budget bytes.
+    """
+    bytes_per_movie = sum(stats[key][:1].nbytes for key in PoolStatistics.COUNT_KEYS)
+    # The sparse ethnicity rows are copied twice (selection and coo conversion)
+    bytes_per_movie += 2*3*8*stats['eth'].nnz/max(stats['eth'].shape[0], 1)
+    return max(1, int(memory_budget//(bytes_per_movie*pool_size)))
+
+
+def score_pools(score_id, pools, stats, ref):
+    """
+    Score the (number of pools x pool size) array @pools of movie positions with @score_id,
+    returning the same keys as function_dic[score_id] would.
+    """
+    if score_id == 'tot':
+        return PoolStatistics.pools_representativeness_score(pools, stats, ref, weights_dic)
+    counts = PoolStatistics.pools_counts(stats, pools)
+    return PoolStatistics.counts_scores(counts, ref, [score_id])
+
+
+def batched_scores_distribution(score_id, df, ref, n_test=N_TEST, pool_size=POOL_SIZE, plot=True,
+                                seed=None, memory_budget=MEMORY_BUDGET, stats=None, verbose=False):
+    """
+    Batched equivalent of scores_distribution: extract @n_test pools of @pool_size movies and assess
+    the corresponding score, returning the same dict {'pool': [...], <score>: [...]}.
+    The draws are reproducible for a given @seed and @memory_budget (which sets the number of pools
+    scored at once). @stats = PoolStatistics.build_movie_statistics(df) can be given to avoid rebuilding it.
+    """
+    if stats is None:
+        stats = PoolStatistics.build_movie_statistics(df)
+    rng = np.random.default_rng(seed)
+    size = batch_size(stats, pool_size, memory_budget)
+
+    pools_list = []
+    scores_list = {}
+    start = time.perf_counter()
+    for first in range(0, n_test, size):
+        pools = sample_pools(len(stats['movie_ids']), min(size, n_test-first), pool_size, rng)
+        for key, values in score_pools(score_id, pools, stats, ref).items():
+            scores_list.setdefault(key, []).append(values)
+        pools_list.append(pools)
+        if verbose:
+            done = first+len(pools)
+            print(f"n_test = {done} ({done/(time.perf_counter()-start):.0f} pools/s)")
+
+    scores_list = {key: np.concatenate(values).tolist() for key, values in scores_list.items()}
+    pools = np.concatenate(pools_list) if pools_list else np.empty((0, pool_size), dtype=np.int64)
+    scores_list = {'pool': list(stats['movie_ids'][pools]), **scores_list}
+
+    if plot:
+        plot_scores_distribution(scores_list, n_test, pool_size)
+
+    return scores_list
+
+
+####################################
+#####  Multi-core execution  #######
+####################################
+
+# Statistics opened read-only by each worker process
+_worker_stats = None
+
+
+def save_shared_statistics(stats, folder):
+    """
+    Save the arrays of @stats needed to score pools in @folder, to be memory-mapped by the workers.
+    """
+    arrays = {key: stats[key] for key in PoolStatistics.COUNT_KEYS+['movie_ids']}
+    arrays.update({'eth_data': stats['eth'].data, 'eth_indices': stats['eth'].indices,
+                   'eth_indptr': stats['eth'].indptr, 'eth_shape': np.array(stats['eth'].shape)})
+    for key, array in arrays.items():
+        np.save(os.path.join(folder, key+'.npy'), array)
+
+
+def open_shared_statistics(folder):
+    """
+    Memory-map the statistics saved by save_shared_statistics (the pages are shared between processes).
+    """
+    load = lambda key: np.load(os.path.join(folder, key+'.npy'), mmap_mode='r')
+    stats = {key: load(key) for key in PoolStatistics.COUNT_KEYS+['movie_ids']}
+    stats['eth'] = sparse.csr_matrix((load('eth_data'), load('eth_indices'), load('eth_indptr')),
+                                     shape=tuple(load('eth_shape')), copy=False)
+    return stats
+
+
+def _init_worker(folder):
+    global _worker_stats
+    _worker_stats = open_shared_statistics(folder)
+
+
+def _score_chunk(score_id, ref, n_pools, pool_size, seed_sequence, memory_budget, stats=None):
+    """
+    Draw and score @n_pools pools with the random stream given by @seed_sequence.
+    """
+    stats = _worker_stats if stats is None else stats
+    rng = np.random.default_rng(seed_sequence)
+    size = batch_size(stats, pool_size, memory_budget)
+    pools_list = []
+    scores_list = {}
+    for first in range(0, n_pools, size):
+        pools = sample_pools(len(stats['movie_ids']), min(size, n_pools-first), pool_size, rng)
+        for key, values in score_pools(score_id, pools, stats, ref).items():
+            scores_list.setdefault(key, []).append(values)
+        pools_list.append(pools)
+    return np.concatenate(pools_list), {key: np.concatenate(values) for key, values in scores_list.items()}
+
+
+def parallel_scores_distribution(score_id, df, ref, n_test=N_TEST, pool_size=POOL_SIZE, plot=True, seed=None,
+                                 n_workers=None, chunk_size=CHUNK_SIZE, memory_budget=MEMORY_BUDGET, stats=None):
+    """
+    Multi-core equivalent of batched_scores_distribution, returning the same dict.
+    The pools are drawn by chunks of @chunk_size, each with its own random stream spawned from @seed,
+    so that the result only depends on @seed and @chunk_size and not on the number of workers.
+    The statistics are saved once in a memory-mapped folder shared read-only by the @n_workers processes
+    (all the cores by default) instead of pickling the actor dataframe to each of them.
+    """
+    if stats is None:
+        stats = PoolStatistics.build_movie_statistics(df)
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    chunks = [min(chunk_size, n_test-first) for first in range(0, n_test, chunk_size)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(score_id, ref, n_pools, pool_size, seed_sequence, memory_budget)
+             for n_pools, seed_sequence in zip(chunks, seed_sequences)]
+
+    if n_workers == 1:
+        results = [_score_chunk(*task, stats=stats) for task in tasks]
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            save_shared_statistics(stats, folder)
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                     initargs=(folder,)) as executor:
+                results = list(executor.map(_score_chunk, *zip(*tasks)))
+
+    scores_list = {'pool': []}
+    for pools, scores in results:
+        scores_list['pool'].extend(stats['movie_ids'][pools])
+        for key, values in scores.items():
+            scores_list.setdefault(key, []).extend(values.tolist())
+
+    if plot:
+        plot_scores_distribution(scores_list, n_test, pool_size)
+
+    return scores_list
+
+
+def parallel_throughput(score_id, df, ref, n_test=100000, pool_size=POOL_SIZE, workers_list=None, seed=0):
+    """
+    Time parallel_scores_distribution with 1 to all the cores (or the numbers of workers of @workers_list)
+    and return the number of pools scored per second and the speedup over one worker.
+    """
+    stats = PoolStatistics.build_movie_statistics(df)
+    if workers_list is None:
+        workers_list = range(1, os.cpu_count()+1)
+    results = []
+    for n_workers in workers_list:
+        start = time.perf_counter()
+        parallel_scores_distribution(score_id, df, ref, n_test, pool_size, plot=False, seed=seed,
+                                     n_workers=n_workers, stats=stats)
+        seconds = time.perf_counter()-start
+        results.append({'n_workers': n_workers, 'seconds': seconds, 'pools_per_second': n_test/seconds})
+    results = pd.DataFrame(results)
+    results['speedup'] = results['pools_per_second']/results['pools_per_second'].iloc[0]
+    return results
@@ -0,0 +1,181 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+
+"""
+This file contains the functions to build and query a dense (firstname x year x sex) cube of the number
+of births, persisted as a memory-mapped file, so that the firstname analyses run as array operations.
+A cube is a dict with the keys 'counts' (the memory-mapped array), 'names' (pd.Index of the firstnames),
+'years' (array of the years) , 'sexes' (list of the sexes) and 'totals' (births per year and sex).
+"""
+
+CUBE_FOLDER = './DATA/Cache/name_cube'
+SEXES = ['F', 'M']
+
+
+def build_name_cube(baby_nameDF, cube_folder=CUBE_FOLDER):
+    """
+    Build the cube from the dataframe given by DataImport.OpenBabyNameDf, save it in @cube_folder
+    and return it memory-mapped. The rows whose sex is not one of SEXES are ignored.
+    """
+    baby_nameDF = baby_nameDF[baby_nameDF['Sexe'].astype(str).isin(SEXES)]
+    names = pd.Index(pd.unique(baby_nameDF['Firstname'].astype(str)))
+    years = baby_nameDF['Year'].astype(int)
+    first_year, last_year = years.min(), years.max()
+
+    name_id = names.get_indexer(baby_nameDF['Firstname'].astype(str))
+    year_id = (years - first_year).to_numpy()
+    sex_id = pd.Index(SEXES).get_indexer(baby_nameDF['Sexe'].astype(str))
+
+    os.makedirs(cube_folder, exist_ok=True)
+    counts = np.lib.format.open_memmap(os.path.join(cube_folder, 'counts.npy'), mode='w+', dtype=np.uint32,
+                                       shape=(len(names), last_year-first_year+1, len(SEXES)))
+    counts[:] = 0
+    np.add.at(counts, (name_id, year_id, sex_id), baby_nameDF['Number'].to_numpy(np.uint32))
+    counts.flush()
+    del counts
+
+    with open(os.path.join(cube_folder, 'metadata.json'), 'w') as f:
+        json.dump({'names': names.tolist(), 'first_year': int(first_year), 'sexes': SEXES}, f)
+
+    return open_name_cube(cube_folder)
+
+
+def open_name_cube(cube_folder=CUBE_FOLDER):
+    """
+    Open the cube saved in @cube_folder without loading the counts in memory.
+    """
+    with open(os.path.join(cube_folder, 'metadata.json')) as f:
+        metadata = json.load(f)
+    counts = np.load(os.path.join(cube_folder, 'counts.npy'), mmap_mode='r')
+    return {'counts': counts,
+            'names': pd.Index(metadata['names']),
+            'years': np.arange(metadata['first_year'], metadata['first_year']+counts.shape[1]),
+            'sexes': metadata['sexes'],
+            'totals': counts.sum(axis=0, dtype=np.int64)}
+
+
+def name_ids(cube, names):
+    """
+    Return the index of each of @names in the cube (-1 if the firstname is unknown).
+    """
+    return cube['names'].get_indexer(pd.Index(names).astype(str))
+
+
+def _year_slice(cube, first_year=None, last_year=None):
+    years = cube['years']
+    start = 0 if first_year is None else max(int(first_year)-years[0], 0)
+    stop = len(years) if last_year is None else min(int(last_year)-years[0]+1, len(years))
+    return slice(start, stop)
+
+
+def _name_counts(cube, names, years_slice, sex):
+    """
+    Counts of @names over the years of @years_slice, for @sex ('F', 'M' or None for both).
+    Unknown firstnames get a count of 0.
+    """
+    ids = name_ids(cube, names)
+    counts = cube['counts'][np.maximum(ids, 0), years_slice]
+    totals = cube['totals'][years_slice]
+    if sex is None:
+        counts = counts.sum(axis=2, dtype=np.int64)
+        totals = totals.sum(axis=1)
+    else:
+        sex_id = cube['sexes'].index(sex)
+        counts = counts[:, :, sex_id].astype(np.int64)
+        totals = totals[:, sex_id]
+    counts[ids < 0] = 0
+    return counts, totals
+
+
+def normalized_frequency(cube, names, first_year=None, last_year=None, sex=None):
+    """
+    Return the (len(@names) x number of years) array of the number of births of each firstname
+    divided by the total number of births of the year, between @first_year and @last_year.
+    """
+    counts, totals = _name_counts(cube, names, _year_slice(cube, first_year, last_year), sex)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts/totals
+
+
+def cumulative_counts(cube, names, first_year=None, last_year=None, sex=None):
+    """
+    Return the number of births of each of @names between @first_year and @last_year (included).
+    """
+    counts, _ = _name_counts(cube, names, _year_slice(cube, first_year, last_year), sex)
+    return counts.sum(axis=1)
+
+
+def peak_year(cube, names, sex=None, normalized=True):
+    """
+    Return the year where each of @names was the most given (in frequency if @normalized, else in number),
+    -1 if it was never given.
+    """
+    counts, totals = _name_counts(cube, names, slice(None), sex)
+    values = counts
+    if normalized:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.nan_to_num(counts/totals)
+    return np.where(counts.any(axis=1), cube['years'][values.argmax(axis=1)], -1)
+
+
+def first_appearance_year(cube, names, sex=None):
+    """
+    Return the first year where each of @names was given (-1 if it was never given).
+    """
+    counts, _ = _name_counts(cube, names, slice(None), sex)
+    given = counts > 0
+    return np.where(given.any(axis=1), cube['years'][given.argmax(axis=1)], -1)
+
+
+def top_names(cube, year, n=20, sex=None, restrict_to=None):
+    """
+    Return the @n firstnames the most given in @year (optionally only among @restrict_to),
+    with their number of births, as a dataframe sorted by decreasing number.
+    """
+    year_id = int(year)-cube['years'][0]
+    counts = cube['counts'][:, year_id]
+    counts = counts.sum(axis=1, dtype=np.int64) if sex is None else counts[:, cube['sexes'].index(sex)].astype(np.int64)
+    if restrict_to is not None:
+        ids = name_ids(cube, pd.unique(pd.Series(restrict_to).dropna()))
+        ids = ids[ids >= 0]
+    else:
+        ids = np.arange(len(counts))
+    n = min(n, len(ids))
+    best = ids[np.argpartition(-counts[ids], n-1)[:n]] if n > 0 else ids[:0]
+    best = best[np.argsort(-counts[best], kind='stable')]
+    return pd.DataFrame({'Firstname': cube['names'][best], 'Number': counts[best]})
+
+
+def movie_name_frequency(cube, firstnames, movie_years):
+    """
+    Return the list of the distinct firstnames of @firstnames (e.g. characterDF["Character firstname"]) known
+    by the cube and the array of their frequency in the movies of each year of the cube: number of occurrences
+    of the firstname divided by the number of firstnames of the movies of the year.
+    """
+    data = pd.DataFrame({'name': firstnames, 'year': movie_years}).dropna()
+    data = data[(data['year'] >= cube['years'][0]) & (data['year'] <= cube['years'][-1])]
+    names, name_index = np.unique(data['name'].astype(str), return_inverse=True)
+    year_index = data['year'].astype(int).to_numpy()-cube['years'][0]
+
+    occurrences = np.zeros((len(names), len(cube['years'])))
+    np.add.at(occurrences, (name_index, year_index), 1)
+    keep = name_ids(cube, names) >= 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frequency = np.nan_to_num(occurrences/occurrences.sum(axis=0))
+    return names[keep], frequency[keep]
+
+
+def time_delay(cube, names, movie_frequency, sex=None):
+    """
+    Cross-correlate, for each of @names, its birth frequency with its frequency in the movies
+    (rows of @movie_frequency, one column per year of the cube) and return the time delay
+    maximizing the correlation and its value. Same convention as np.correlate(birth, movie, mode='full'):
+    the delay is positive when the births follow the movies.
+    """
+    birth_frequency = np.nan_to_num(normalized_frequency(cube, names, sex=sex))
+    correlation = fftconvolve(birth_frequency, movie_frequency[:, ::-1], mode='full', axes=1)
+    best = correlation.argmax(axis=1)
+    return best-(birth_frequency.shape[1]-1), correlation[np.arange(len(best)), best]
@@ -2,6 +2,9 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 import networkx as nx
 import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
 import plotly.graph_objects as go
 
 # Helper function for printing various graph properties
@@ -16,4 +19,108 @@ def describe_graph(G):
         print("Diameter and Avg shortest path length are not defined!")
     print("Sparsity: %.4f" %nx.density(G))  # #edges/#edges-complete-graph
     # #closed-triplets(3*#triangles)/#all-triplets
-    print("Global clustering coefficient aka Transitivity: %.4f" %nx.transitivity(G))
\ No newline at end of file
+    print("Global clustering coefficient aka Transitivity: %.4f" %nx.transitivity(G))
+
+# Sparse graphs built from the character table, for graphs too big for the exact networkx metrics
+def build_actor_graph(characterDF, kind='co-actor', actor_column='Actor Name', movie_column='Wikipedia movie ID'):
+    """
+    Build the adjacency of the actor graph of characterDF as a scipy sparse matrix, without networkx.
+    kind='co-actor': one node per actor, the weight of an edge being the number of movies the two actors share.
+    kind='movie-actor': bipartite graph with the actors first and then the movies.
+    Returns the adjacency (csr) and the labels of the nodes.
+    """
+    data = characterDF[[actor_column, movie_column]].dropna().drop_duplicates()
+    actor_index, actors = pd.factorize(data[actor_column])
+    movie_index, movies = pd.factorize(data[movie_column])
+    incidence = sparse.csr_matrix((np.ones(len(data), dtype=np.int32), (actor_index, movie_index)),
+                                  shape=(len(actors), len(movies)))
+    if kind == 'co-actor':
+        adjacency = (incidence @ incidence.T).tocsr()
+        adjacency = (adjacency - sparse.diags(adjacency.diagonal(), dtype=adjacency.dtype)).tocsr()
+        adjacency.eliminate_zeros()
+        return adjacency, np.asarray(actors)
+    if kind == 'movie-actor':
+        adjacency = sparse.bmat([[None, incidence], [incidence.T, None]], format='csr')
+        return adjacency, np.concatenate([np.asarray(actors, dtype=object), np.asarray(movies, dtype=object)])
+    raise ValueError("Unknown graph kind " + str(kind) + ", expected 'co-actor' or 'movie-actor'")
+
+
+def component_stats(adjacency):
+    """
+    Number of connected components, size of the largest one and fraction of the nodes it contains.
+    Also returns the label of the component of each node.
+    """
+    n_components, labels = csgraph.connected_components(adjacency, directed=False)
+    sizes = np.bincount(labels)
+    return {'n_components': n_components, 'largest_component': int(sizes.max()) if len(sizes) else 0,
+            'largest_fraction': sizes.max()/len(labels) if len(labels) else 0., 'isolated_nodes': int((sizes == 1).sum())}, labels
+
+
+def sparse_transitivity(adjacency, block_size=1024):
+    """
+    Exact transitivity (3 x number of triangles / number of connected triplets) from sparse products.
+    The paths of length 2 are counted by blocks of block_size rows, so that the whole product (much denser
+    than the graph when it has hubs) is never built.
+    """
+    binary = sparse.csr_matrix(adjacency != 0, dtype=np.int64)
+    degrees = np.asarray(binary.sum(axis=1)).ravel()
+    closed = 0
+    for first in range(0, binary.shape[0], block_size):
+        rows = binary[first:first+block_size]
+        closed += (rows @ binary).multiply(rows).sum()
+    triplets = (degrees*(degrees-1)).sum()
+    return closed/triplets if triplets else 0.
+
+
+def sampled_path_stats(adjacency, n_samples=100, seed=None, batch_size=16, z=1.96):
+    """
+    Estimate the average shortest path length and the diameter of the largest connected component with
+    breadth-first searches from n_samples random nodes (unweighted).
+    The average comes with the half width of its confidence interval (z standard errors of the mean over the sources).
+    The diameter is bounded by the largest eccentricity found (lower bound) and twice the smallest one (upper bound),
+    both exact if all the nodes are sampled.
+    """
+    rng = np.random.default_rng(seed)
+    _, labels = component_stats(adjacency)
+    nodes = np.flatnonzero(labels == np.bincount(labels).argmax())
+    component = adjacency[nodes][:, nodes]
+    sources = rng.choice(len(nodes), size=min(n_samples, len(nodes)), replace=False)
+
+    means, eccentricities = [], []
+    for first in range(0, len(sources), batch_size):
+        distances = csgraph.shortest_path(component, method='D', directed=False, unweighted=True,
+                                          indices=sources[first:first+batch_size])
+        means.append(distances.sum(axis=1)/max(len(nodes)-1, 1))
+        eccentricities.append(distances.max(axis=1))
+    means, eccentricities = np.concatenate(means), np.concatenate(eccentricities)
+
+    exact = len(sources) == len(nodes)
+    error = 0. if (exact or len(means) < 2) else z*means.std(ddof=1)/np.sqrt(len(means))
+    return {'n_sources': len(sources), 'avg_shortest_path_length': means.mean(), 'avg_path_error': error,
+            'diameter_lower': int(eccentricities.max()),
+            'diameter_upper': int(eccentricities.max()) if exact else int(min(2*eccentricities.min(), len(nodes)-1))}
+
+
+def describe_sparse_graph(adjacency, n_samples=100, seed=None):
+    """
+    Same description as describe_graph for a sparse adjacency (e.g. from build_actor_graph), with the sampled
+    estimates of sampled_path_stats (computed on the largest connected component) and the exact sparse transitivity.
+    Returns the metrics as a dict.
+    """
+    n_nodes = adjacency.shape[0]
+    n_edges = (adjacency != 0).sum()//2
+    metrics = {'n_nodes': n_nodes, 'n_edges': int(n_edges),
+               'density': 2*n_edges/(n_nodes*(n_nodes-1)) if n_nodes > 1 else 0.}
+    metrics.update(component_stats(adjacency)[0])
+    metrics.update(sampled_path_stats(adjacency, n_samples, seed))
+    metrics['transitivity'] = sparse_transitivity(adjacency)
+
+    print("Graph with %d nodes and %d edges" % (n_nodes, n_edges))
+    print("Connected components: %d (largest: %d nodes, %.2f%%)" % (metrics['n_components'], metrics['largest_component'],
+                                                                   100*metrics['largest_fraction']))
+    print("Avg. Shortest Path Length (largest component, %d sources): %.4f +/- %.4f"
+          % (metrics['n_sources'], metrics['avg_shortest_path_length'], metrics['avg_path_error']))
+    print("Diameter (largest component): between %d and %d" % (metrics['diameter_lower'], metrics['diameter_upper']))
+    print("Sparsity: %.4f" % metrics['density'])
+    print("Global clustering coefficient aka Transitivity: %.4f" % metrics['transitivity'])
+    return metrics
@@ -0,0 +1,75 @@
+import os
+import mmap
+import numpy as np
+import pandas as pd
+
+"""
+This file contains an offset index of the plot summaries file ("movie id\tplot" lines), saved next to the file,
+giving the byte range of the plot of each movie so that the plots of a few movies are read from the memory-mapped
+file without parsing the rest of it.
+An index is a (number of plots x 3) int64 array of the movie ids (sorted), and the first and last (excluded) byte
+of their plot.
+"""
+
+PLOT_FILE = './DATA/MovieSummaries/plot_summaries.txt'
+
+
+def index_file_of(plot_file):
+    """
+    Path of the index of @plot_file (saved in the same folder).
+    """
+    return os.path.splitext(plot_file)[0]+'.index.npy'
+
+
+def build_plot_index(plot_file=PLOT_FILE, index_file=None):
+    """
+    Scan @plot_file once and save the byte range of the plot of each movie in @index_file
+    (next to the plot file by default). Returns the index.
+    """
+    index_file = index_file_of(plot_file) if index_file is None else index_file
+    ids, starts, ends = [], [], []
+    offset = 0
+    with open(plot_file, 'rb') as f:
+        for line in f:
+            tab = line.find(b'\t')
+            if tab > 0:
+                end = offset+len(line.rstrip(b'\r\n'))
+                ids.append(int(line[:tab]))
+                starts.append(offset+tab+1)
+                ends.append(end)
+            offset += len(line)
+
+    index = np.array([ids, starts, ends], dtype=np.int64).T.reshape(-1, 3)
+    # Stable sort so that the first plot of a movie is kept if it appears twice
+    index = index[np.argsort(index[:, 0], kind='stable')]
+    np.save(index_file, index)
+    return index
+
+
+def open_plot_index(plot_file=PLOT_FILE, index_file=None):
+    """
+    Load the index of @plot_file, building it first if it does not exist or is older than the plot file.
+    """
+    index_file = index_file_of(plot_file) if index_file is None else index_file
+    if not os.path.exists(index_file) or os.path.getmtime(index_file) < os.path.getmtime(plot_file):
+        return build_plot_index(plot_file, index_file)
+    return np.load(index_file)
+
+
+def read_plots(movie_ids, plot_file=PLOT_FILE, index=None):
+    """
+    Return the series movie id -> plot of the movies of @movie_ids which have a plot in @plot_file, in the
+    order of @movie_ids. Only the byte ranges of these plots are read from the memory-mapped file.
+    The texts are the raw lines of the file (pd.read_csv would interpret the quotes at the start of a plot).
+    """
+    index = open_plot_index(plot_file) if index is None else index
+    movie_ids = np.asarray(pd.unique(np.asarray(movie_ids, dtype=np.int64)))
+    positions = np.minimum(np.searchsorted(index[:, 0], movie_ids), len(index)-1)
+    found = (index[positions, 0] == movie_ids) if len(index) else np.zeros(len(movie_ids), dtype=bool)
+    positions = positions[found]
+
+    plots = []
+    if len(positions):
+        with open(plot_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            plots = [mapped[start:end].decode('utf-8') for start, end in index[positions, 1:].tolist()]
+    return pd.Series(plots, index=pd.Index(movie_ids[found], name='Wikipedia movie ID'), name='Plot', dtype=object)
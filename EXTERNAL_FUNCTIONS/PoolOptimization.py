@@ -0,0 +1,295 @@
+import time
+import numpy as np
+import pandas as pd
+
+from EXTERNAL_FUNCTIONS import PoolStatistics
+from EXTERNAL_FUNCTIONS import MonteCarloScoring
+from EXTERNAL_FUNCTIONS.ScoringRelatedFunctions import weights_dic
+
+"""
+This file contains the optimizers looking for the most representative pools of movies.
+They keep the running statistics of the current pool (see PoolStatistics) and update them
+when a movie is added or removed, instead of rescoring the pool from the actor dataframe.
+"""
+
+
+####################################
+#####  Running pool statistics  ####
+####################################
+
+
+def init_pool_state(stats, positions):
+    """
+    Statistics of the pool made of the movies at @positions in @stats, including the number of actors
+    of each ethnicity so that movies can then be added and removed.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    state = {key: stats[key][positions].sum(axis=0) for key in PoolStatistics.COUNT_KEYS}
+    state['eth_counts'] = np.asarray(stats['eth'][positions].sum(axis=0)).ravel()
+    state['n_distinct_eth'] = int((state['eth_counts'] > 0).sum())
+    state['positions'] = list(positions)
+    return state
+
+
+def _eth_row(stats, position):
+    start, end = stats['eth'].indptr[position], stats['eth'].indptr[position+1]
+    return stats['eth'].indices[start:end], stats['eth'].data[start:end]
+
+
+def add_movie(stats, state, position):
+    """
+    Add the movie at @position to the pool of @state, in place.
+    """
+    for key in PoolStatistics.COUNT_KEYS:
+        state[key] = state[key]+stats[key][position]
+    columns, data = _eth_row(stats, position)
+    state['n_distinct_eth'] += int((state['eth_counts'][columns] == 0).sum())
+    state['eth_counts'][columns] += data
+    state['positions'].append(position)
+
+
+def remove_movie(stats, state, position):
+    """
+    Remove the movie at @position from the pool of @state, in place.
+    """
+    for key in PoolStatistics.COUNT_KEYS:
+        state[key] = state[key]-stats[key][position]
+    columns, data = _eth_row(stats, position)
+    state['eth_counts'][columns] -= data
+    state['n_distinct_eth'] -= int((state['eth_counts'][columns] == 0).sum())
+    state['positions'].remove(position)
+
+
+def state_counts(state):
+    """
+    Counts of the pool of @state, as given by PoolStatistics.pools_counts for a single pool.
+    """
+    counts = {key: np.asarray(state[key])[np.newaxis] for key in PoolStatistics.COUNT_KEYS}
+    counts['n_distinct_eth'] = np.array([state['n_distinct_eth']])
+    return counts
+
+
+def candidates_counts(stats, state, candidates, eth_binary=None):
+    """
+    Counts of the pools obtained by adding each movie of @candidates (positions in @stats)
+    to the pool of @state, for all the candidates at once.
+    """
+    counts = {key: state[key]+stats[key][candidates] for key in PoolStatistics.COUNT_KEYS}
+    if eth_binary is None:
+        eth_binary = stats['eth'].sign()
+    # Ethnicities of each candidate which are not yet in the pool
+    missing = (state['eth_counts'] == 0).astype(np.int64)
+    counts['n_distinct_eth'] = state['n_distinct_eth']+eth_binary[candidates]@missing
+    return counts
+
+
+def counts_total(counts, ref, weights=weights_dic):
+    """
+    Aggregated score between 0 and 1 (before the truncation to an integer between 0 and 100 of
+    representativeness_score) of each pool of @counts.
+    """
+    return PoolStatistics.aggregate_scores(PoolStatistics.counts_scores(counts, ref, weights), weights)
+
+
+#######################################
+#####  Greedy (improvement) search  ###
+#######################################
+
+
+def greedy_improvement(stats, ref, initial_movies_id, weights=weights_dic, state=None, eth_binary=None):
+    """
+    Find the movie whose addition to the pool @initial_movies_id increases at most the score, by scoring
+    the additions of all the movies of @stats in a single vectorized pass.
+    Returns the list of the movie ids of the new pool and its score (between 0 and 100), the first movie
+    in the order of @stats being kept in case of tie as ScoringRelatedFunctions.improvement does.
+    """
+    if state is None:
+        state = init_pool_state(stats, PoolStatistics.movie_positions(initial_movies_id, stats))
+    candidates = np.setdiff1d(np.arange(len(stats['movie_ids'])), state['positions'])
+    totals = (counts_total(candidates_counts(stats, state, candidates, eth_binary), ref, weights)*100).astype(int)
+    best = totals.argmax()
+    return list(initial_movies_id)+[stats['movie_ids'][candidates[best]]], int(totals[best])
+
+
+def greedy_best_pool(df, ref, initial_size=10, final_size=20, n_test=1000, weights=weights_dic, seed=None,
+                     stats=None, verbose=True):
+    """
+    Improve the best of @n_test random pools of @initial_size movies by adding the best movie, with
+    greedy_improvement, until the number of movies in the pool is @final_size.
+    Returns the list of the movie ids of the pool and its score.
+    """
+    if stats is None:
+        stats = PoolStatistics.build_movie_statistics(df)
+    scores = MonteCarloScoring.batched_scores_distribution('tot', df, ref, n_test=n_test, pool_size=initial_size,
+                                                           plot=False, seed=seed, stats=stats)
+    max_score = max(scores['tot'])
+    movies_id = list(scores['pool'][scores['tot'].index(max_score)])
+    if verbose:
+        print(f'The maximal score is {max_score}, corresponding to the following pool : {movies_id}.')
+
+    state = init_pool_state(stats, PoolStatistics.movie_positions(movies_id, stats))
+    eth_binary = stats['eth'].sign()
+    for i in range(final_size-initial_size):
+        movies_id, max_score = greedy_improvement(stats, ref, movies_id, weights, state, eth_binary)
+        add_movie(stats, state, stats['index'].get_loc(movies_id[-1]))
+        if verbose:
+            print(f"Improvement {i+1} : adding movie {movies_id[-1]} gives a new score of {max_score}.")
+    return movies_id, max_score
+
+
+######################################################
+#####  Local search over pools of a fixed size  ######
+######################################################
+
+
+def _state_score(state, ref, weights):
+    return float(counts_total(state_counts(state), ref, weights)[0])
+
+
+def swap_local_search(stats, ref, positions, weights=weights_dic, max_iter=100, time_limit=None, trace=None,
+                      eth_binary=None):
+    """
+    Best-improvement local search: at each iteration, the swap (one movie of the pool replaced by a movie outside)
+    increasing at most the score is applied, all the candidates of a removed movie being scored at once.
+    Stops at a local optimum, after @max_iter swaps or @time_limit seconds.
+    Returns the final state, its score and the number of swaps evaluated.
+    """
+    start = time.perf_counter()
+    eth_binary = stats['eth'].sign() if eth_binary is None else eth_binary
+    state = init_pool_state(stats, positions)
+    score = _state_score(state, ref, weights)
+    n_evaluated = 0
+    for iteration in range(max_iter):
+        if time_limit is not None and time.perf_counter()-start > time_limit:
+            break
+        candidates = np.setdiff1d(np.arange(len(stats['movie_ids'])), state['positions'])
+        n_evaluated += len(state['positions'])*len(candidates)
+        best_move, best_score = None, score
+        for out in list(state['positions']):
+            remove_movie(stats, state, out)
+            totals = counts_total(candidates_counts(stats, state, candidates, eth_binary), ref, weights)
+            add_movie(stats, state, out)
+            if totals.max() > best_score:
+                best_move, best_score = (out, candidates[totals.argmax()]), totals.max()
+        if best_move is None:
+            break
+        remove_movie(stats, state, best_move[0])
+        add_movie(stats, state, best_move[1])
+        score = float(best_score)
+        if trace is not None:
+            trace.append({'method': 'swap', 'iteration': iteration+1, 'seconds': time.perf_counter()-start,
+                          'score': 100*score, 'best_score': 100*score})
+    return state, score, n_evaluated
+
+
+def simulated_annealing(stats, ref, positions, weights=weights_dic, max_iter=20000, time_limit=None,
+                        initial_temperature=0.02, final_temperature=0.0005, rng=None, trace=None, trace_every=100):
+    """
+    Simulated annealing over pools of fixed size: a random movie of the pool is replaced by a random movie outside,
+    the swap being accepted if it improves the score or with the probability exp(delta/temperature) otherwise.
+    The temperature decreases geometrically from @initial_temperature to @final_temperature over @max_iter moves
+    (or over @time_limit seconds). Each move only updates the running statistics of the pool.
+    Returns the best state found, its score and the number of moves done (one swap evaluated per move).
+    """
+    rng = np.random.default_rng(rng)
+    start = time.perf_counter()
+    n_movies = len(stats['movie_ids'])
+    state = init_pool_state(stats, positions)
+    if len(set(state['positions'])) >= n_movies:
+        raise ValueError(f"The pool contains all the {n_movies} movies, no movie can be swapped in")
+    in_pool = np.zeros(n_movies, dtype=bool)
+    in_pool[state['positions']] = True
+    score = _state_score(state, ref, weights)
+    best_positions, best_score = list(state['positions']), score
+
+    iteration = 0
+    for iteration in range(1, max_iter+1):
+        elapsed = time.perf_counter()-start
+        if time_limit is not None and elapsed > time_limit:
+            iteration -= 1
+            break
+        progress = elapsed/time_limit if time_limit is not None else iteration/max_iter
+        temperature = initial_temperature*(final_temperature/initial_temperature)**min(progress, 1)
+
+        out = state['positions'][rng.integers(len(state['positions']))]
+        new = rng.integers(n_movies)
+        while in_pool[new]:
+            new = rng.integers(n_movies)
+        remove_movie(stats, state, out)
+        add_movie(stats, state, new)
+        new_score = _state_score(state, ref, weights)
+
+        if new_score >= score or rng.random() < np.exp((new_score-score)/temperature):
+            in_pool[out], in_pool[new] = False, True
+            score = new_score
+            if score > best_score:
+                best_positions, best_score = list(state['positions']), score
+        else:
+            remove_movie(stats, state, new)
+            add_movie(stats, state, out)
+
+        if trace is not None and iteration % trace_every == 0:
+            trace.append({'method': 'annealing', 'iteration': iteration, 'seconds': time.perf_counter()-start,
+                          'score': 100*score, 'best_score': 100*best_score})
+
+    return init_pool_state(stats, best_positions), best_score, iteration
+
+
+def optimize_pool(df, ref, pool_size=20, method='annealing', n_restarts=5, max_iter=20000, time_limit=None,
+                  weights=weights_dic, seed=None, stats=None, initial_movies_id=None):
+    """
+    Look for the most representative pool of @pool_size movies with @method ('annealing' : simulated annealing
+    followed by a swap local search, or 'swap' : swap local search only) from @n_restarts random pools
+    (the first one being @initial_movies_id if given). @time_limit is the time (seconds) of each restart, the swap
+    local search getting the time left by the annealing. @max_iter bounds the moves of the annealing and the
+    swaps of the local search of each restart.
+    Returns a dict with the best 'pool' (movie ids), its 'score' (between 0 and 100), the number of swaps evaluated
+    by each method ('moves', the swap local search evaluating all the swaps of the pool at each iteration),
+    the 'seconds' spent in each method, the overall number of 'moves_per_second' and the 'trace' dataframe of the
+    score over time.
+    """
+    if stats is None:
+        stats = PoolStatistics.build_movie_statistics(df)
+    rng = np.random.default_rng(seed)
+    eth_binary = stats['eth'].sign()
+    n_movies = len(stats['movie_ids'])
+    if pool_size >= n_movies:
+        raise ValueError(f"pool_size ({pool_size}) must be smaller than the number of movies ({n_movies})")
+
+    start = time.perf_counter()
+    best_state, best_score = None, -np.inf
+    moves = {'annealing': 0, 'swap': 0}
+    seconds = {'annealing': 0., 'swap': 0.}
+    traces = []
+    for restart in range(n_restarts):
+        if restart == 0 and initial_movies_id is not None:
+            positions = PoolStatistics.movie_positions(initial_movies_id, stats)
+        else:
+            positions = rng.choice(n_movies, size=pool_size, replace=False)
+
+        trace = []
+        restart_start = time.perf_counter()
+        if method == 'annealing':
+            state, score, n_moves = simulated_annealing(stats, ref, positions, weights, max_iter, time_limit,
+                                                        rng=rng, trace=trace)
+            moves['annealing'] += n_moves
+            positions = state['positions']
+        elif method != 'swap':
+            raise ValueError(f"Unknown method {method}, expected 'annealing' or 'swap'")
+        swap_start = time.perf_counter()
+        seconds['annealing'] += swap_start-restart_start
+        remaining = None if time_limit is None else max(time_limit-(swap_start-restart_start), 0.)
+        state, score, n_moves = swap_local_search(stats, ref, positions, weights, max_iter, remaining, trace, eth_binary)
+        moves['swap'] += n_moves
+        seconds['swap'] += time.perf_counter()-swap_start
+
+        traces.append(pd.DataFrame(trace).assign(restart=restart))
+        if score > best_score:
+            best_state, best_score = state, score
+
+    return {'pool': list(stats['movie_ids'][best_state['positions']]),
+            'score': int(best_score*100),
+            'moves': moves,
+            'seconds': seconds,
+            'moves_per_second': sum(moves.values())/(time.perf_counter()-start),
+            'trace': pd.concat(traces, ignore_index=True)}
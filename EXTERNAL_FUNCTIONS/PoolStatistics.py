@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from EXTERNAL_FUNCTIONS.ScoringRelatedFunctions import scoring_function, standardized_score, weighted_bins_score
+from EXTERNAL_FUNCTIONS.ScoringRelatedFunctions import weights_dic, heights_in_cm
+
+"""
+This file contains a per-movie table of the sufficient statistics needed by the scores of
+ScoringRelatedFunctions (gender counts, age and height histograms per gender, ethnicities).
+The statistics of a pool of movies are the sums of the rows of its movies, so that any pool
+(or a whole batch of pools) is scored without filtering the actor dataframe again.
+"""
+
+AGE_EDGES = np.arange(0, 80, 5)
+HEI_EDGES = np.arange(142, 193, 3)
+AGE_WEIGHTS = [5,5,5,5,1,1,1,1,1,3,3,3,3,5,5,5,5]
+HEI_WEIGHTS = [3,3,3,3,2,2,1,1,1,2,2,2,3,3,3,3,3]
+
+# Statistics summed over the movies of a pool
+COUNT_KEYS = ['n_rows', 'n_gender', 'n_F', 'n_M', 'n_eth', 'age_M', 'age_F', 'hei_M', 'hei_F']
+
+
+def _bin_index(values, edges):
+    """
+    Index of the bin of each value, with the same convention as np.histogram
+    (last edge included), -1 if the value is out of the bins or nan.
+    """
+    index = np.searchsorted(edges, values, side='right')-1
+    index[values == edges[-1]] = len(edges)-2
+    index[~((values >= edges[0]) & (values <= edges[-1]))] = -1
+    return index
+
+
+def _bin_counts(movie_index, bin_index, mask, n_movies, n_bins):
+    keep = mask & (bin_index >= 0)
+    counts = np.zeros((n_movies, n_bins), dtype=np.int64)
+    np.add.at(counts, (movie_index[keep], bin_index[keep]), 1)
+    return counts
+
+
+def build_movie_statistics(df):
+    """
+    Build the statistics of each movie of the actor dataframe @df, in the order of df['Wikipedia movie ID'].unique().
+    Returns a dict of arrays with one row per movie, and the sparse (movie x ethnicity) matrix of the number of
+    actors of each ethnicity in 'eth'.
+    """
+    movie_index, movie_ids = pd.factorize(df['Wikipedia movie ID'])
+    n_movies = len(movie_ids)
+    gender = df['Actor gender']
+    is_M = (gender == 'M').to_numpy()
+    is_F = (gender == 'F').to_numpy()
+    has_gender = gender.notna().to_numpy()
+
+    ages = df['Actor age at movie release'].to_numpy(dtype=float, na_value=np.nan)
+    heights = heights_in_cm(df['Actor height'].to_numpy(dtype=float, na_value=np.nan))
+    age_bin = _bin_index(ages, AGE_EDGES)
+    hei_bin = _bin_index(heights, HEI_EDGES)
+
+    eth_index, ethnicities = pd.factorize(df['Ethnicity'])
+    has_eth = eth_index >= 0
+
+    stats = {'movie_ids': np.asarray(movie_ids),
+             'index': pd.Index(movie_ids),
+             'ethnicities': ethnicities,
+             'n_rows': np.bincount(movie_index, minlength=n_movies),
+             'n_gender': np.bincount(movie_index, weights=has_gender, minlength=n_movies).astype(np.int64),
+             'n_F': np.bincount(movie_index, weights=is_F, minlength=n_movies).astype(np.int64),
+             'n_M': np.bincount(movie_index, weights=is_M, minlength=n_movies).astype(np.int64),
+             'n_eth': np.bincount(movie_index, weights=has_eth, minlength=n_movies).astype(np.int64),
+             'age_M': _bin_counts(movie_index, age_bin, is_M, n_movies, len(AGE_EDGES)-1),
+             'age_F': _bin_counts(movie_index, age_bin, is_F, n_movies, len(AGE_EDGES)-1),
+             'hei_M': _bin_counts(movie_index, hei_bin, is_M, n_movies, len(HEI_EDGES)-1),
+             'hei_F': _bin_counts(movie_index, hei_bin, is_F, n_movies, len(HEI_EDGES)-1),
+             'eth': sparse.csr_matrix((np.ones(has_eth.sum(), dtype=np.int64),
+                                       (movie_index[has_eth], eth_index[has_eth])),
+                                      shape=(n_movies, len(ethnicities)))}
+    stats['eth'].sum_duplicates()
+    return stats
+
+
+def movie_positions(movies_id, stats):
+    """
+    Return the positions in @stats of the movies of @movies_id (unknown and repeated ids are dropped,
+    as defined_movie_pool does).
+    """
+    positions = stats['index'].get_indexer(pd.unique(np.asarray(movies_id)))
+    return positions[positions >= 0]
+
+
+def distinct_ethnicities(stats, pools):
+    """
+    Number of distinct ethnicities in each pool of the (number of pools x pool size) array @pools
+    of movie positions.
+    """
+    n_pools, pool_size = pools.shape
+    rows = stats['eth'][pools.ravel()].tocoo()
+    pool_of_entry = rows.row//pool_size if pool_size else rows.row
+    pairs = np.unique(pool_of_entry.astype(np.int64)*stats['eth'].shape[1]+rows.col)
+    return np.bincount(pairs//stats['eth'].shape[1], minlength=n_pools)
+
+
+def pools_counts(stats, pools):
+    """
+    Sum the statistics of the movies of each pool of the (number of pools x pool size) array @pools
+    of movie positions.
+    """
+    counts = {key: stats[key][pools].sum(axis=1) for key in COUNT_KEYS}
+    counts['n_distinct_eth'] = distinct_ethnicities(stats, pools)
+    return counts
+
+
+def _histogram_density(bin_counts, bin_width):
+    """
+    Same as np.histogram(..., density=True) from the counts of each bin (nan if no value is in the bins).
+    """
+    return bin_counts/(bin_counts.sum(axis=-1, keepdims=True)*bin_width)
+
+
+def _gender_weighted_score(counts, ref, key, p, sigma, weights, M_bin_width, F_bin_width):
+    p_M = counts['n_M']/counts['n_rows']
+    freq_M = _histogram_density(counts[key+'_M'], M_bin_width)
+    freq_F = counts[key+'_F'] if F_bin_width is None else _histogram_density(counts[key+'_F'], F_bin_width)
+    score_M = np.where(p_M != 0, weighted_bins_score(freq_M, ref['M'], weights, p, sigma), 0)
+    score_F = np.where(p_M != 1, weighted_bins_score(freq_F, ref['F'], weights, p, sigma), 0)
+    return p_M*score_M+(1-p_M)*score_F
+
+
+def counts_scores(counts, ref, keys):
+    """
+    Compute the scores of @keys ('par', 'div', 'AGE', 'age', 'HEI', 'hei') of pools from their summed statistics
+    @counts, with the same parameters as the functions of ScoringRelatedFunctions. Return a dict of arrays.
+    """
+    scores = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for key in keys:
+            if key == 'par':
+                scores[key] = scoring_function(counts['n_F']/counts['n_gender'], ref[key]['F'], 3, 20)
+            elif key == 'div':
+                score = np.where(counts['n_eth'] != 0, counts['n_distinct_eth']/np.maximum(counts['n_eth'], 1), 0)
+                scores[key] = standardized_score(score, min_score=0.25, max_score=0.75)
+            elif key in ['AGE', 'age']:
+                score = _gender_weighted_score(counts, ref[key], 'age', 2.5, 500, AGE_WEIGHTS, 5, 5)
+                scores[key] = score if key == 'AGE' else standardized_score(score, 0.12, 0.35)
+            elif key in ['HEI', 'hei']:
+                # As in height_score, the women histogram is not normalized
+                score = _gender_weighted_score(counts, ref[key], 'hei', 3, 50, HEI_WEIGHTS, 3, None)
+                scores[key] = score if key == 'HEI' else standardized_score(score, 0.5, 0.9)
+            else:
+                raise ValueError(f"Unknown score {key}")
+    return scores
+
+
+def aggregate_scores(scores, weights=weights_dic):
+    """
+    Weighted mean of the sub-scores @scores (0 where it is nan), between 0 and 1.
+    """
+    agg_score = sum(weights[key]*np.asarray(scores[key], dtype=float) for key in weights)/sum(weights.values())
+    return np.nan_to_num(agg_score, nan=0.)
+
+
+def pools_representativeness_score(pools, stats, ref, weights=weights_dic):
+    """
+    Score every pool of the (number of pools x pool size) array @pools of movie positions.
+    Return a dict of arrays with the same keys as representativeness_score.
+    """
+    scores = counts_scores(pools_counts(stats, pools), ref, weights)
+    scores['tot'] = (aggregate_scores(scores, weights)*100).astype(int)
+    return scores
+
+
+def pool_representativeness_score(movies_id, stats, ref, weights=weights_dic):
+    """
+    Same result as representativeness_score(defined_movie_pool(@movies_id, df), @ref, @weights)
+    computed from the statistics @stats = build_movie_statistics(df).
+    """
+    pools = movie_positions(movies_id, stats)[np.newaxis, :]
+    scores = pools_representativeness_score(pools, stats, ref, weights)
+    return {key: (int(value[0]) if key == 'tot' else float(value[0])) for key, value in scores.items()}
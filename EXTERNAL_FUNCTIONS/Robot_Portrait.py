@@ -1,25 +1,21 @@
 #In this file we store all the functions used to make robot portrait of our average human 
+import os
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
 import networkx as nx
 import numpy as np 
 import pandas as pd 
 import matplotlib.pyplot as plt
 import plotly.express as px
 import statsmodels.formula.api as smf
+from scipy import stats
+from scipy import sparse
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
 
 
 
 #Functions for the regression on two movies 
 
-def map(ref,elem): 
-    '''
-    Return the indices of the element elem in list ref 
-    '''
-    n = len(ref)
-    for k in range(n) : 
-        if ref[k] == elem : 
-            return k 
-    return None 
-
 def Linear_reg_results(data,genre_lst,Ref): 
     '''
     This function computes the linear regression on the dataset 'data' filtered to keep only the genres from genre_lst 
@@ -72,48 +68,74 @@ def Linear_reg_plotting(Reg_res):
     plt.ylim((-1,len(Reg_res['reg_var'])))
     plt.show()
 
-def Linear_reg_duels(Genre_list,data):
+def Linear_reg_results_all(data,genre_lst,alpha=0.05): 
+    '''
+    Same results as Linear_reg_results for every reference genre of genre_lst, with a single fit : the model is fitted once with one 
+    indicator per genre (the coefficients are then the mean of each genre) and the coefficients of each reference, their standard errors, 
+    p-values and confidence intervals are derived from the fitted covariance matrix 
+    The movies without box office revenue are dropped, as smf.ols does 
+    Returns a dict reference genre -> dataframe of Linear_reg_results 
+    '''
+    reg_data = data[data['Movie_genres'].isin(genre_lst)]
+    reg_data = reg_data[reg_data['Movie_box_office_revenue_scaled'].notna()]
+    empty = [genre for genre in genre_lst if genre not in set(reg_data['Movie_genres'])]
+    if empty : 
+        raise ValueError('No movie with a box office revenue for the genres ' + str(empty))
+    y = reg_data['Movie_box_office_revenue_scaled'].to_numpy(dtype=float)
+    codes, genres = pd.factorize(reg_data['Movie_genres'], sort=True)
+
+    #One hot design matrix, fitted once 
+    X = np.zeros((len(y), len(genres)))
+    X[np.arange(len(y)), codes] = 1
+    beta, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    df_resid = len(y) - len(genres)
+    sigma2 = ((y - X @ beta)**2).sum()/df_resid
+    cov = sigma2*np.linalg.inv(X.T @ X)
+    t_crit = stats.t.ppf(1 - alpha/2, df_resid)
+
+    results = {}
+    for r, ref in enumerate(genres):
+        others = [k for k in range(len(genres)) if k != r]
+        #Treatment contrasts : coefficient of each genre minus the one of the reference 
+        contrasts = np.eye(len(genres))[others]
+        contrasts[:, r] = -1
+        reg_coef = contrasts @ beta
+        reg_sigma = np.sqrt(np.einsum('ij,jk,ik->i', contrasts, cov, contrasts))
+        reg_pvalues = 2*stats.t.sf(np.abs(reg_coef/reg_sigma), df_resid)
+        reg_var = ['C(Movie_genres, Treatment("'+ref+'"))[T.'+genres[k]+']' for k in others]
+        results[ref] = pd.DataFrame({'reg_var': reg_var, 'reg_coef': reg_coef, 'reg_pvalues': reg_pvalues, 'reg_sigma': reg_sigma,
+                                     'Lower_confidence': reg_coef - t_crit*reg_sigma, 'Higher_confidence': reg_coef + t_crit*reg_sigma})
+    return results
+
+def Linear_reg_duels(Genre_list,data,single_fit=True):
     '''
     This function takes in argumnet Genre_list which is all the genres you want to compare between them and data wich is your dataset.
     It runs multiple linear regressions each time by tacking as a reference one element from the list Genre_list. 
     For each linear regression we keep only the three genres with the highest coefficient and the three genres with the lowest. We give three points to the best, two points to the second best 
     and 1 point to the third best. Then we return two matrices with the refernce genre on the y axis and the best or worst genre in the x axis. 
+    If single_fit, the regressions of all the references are derived from a single fit (see Linear_reg_results_all) instead of one fit per reference. 
     '''
 
     n = len(Genre_list)
+    index = {genre: k for k, genre in enumerate(Genre_list)}
     res_pos = np.zeros((n,n))
     res_neg = np.zeros((n,n))
+    if single_fit : 
+        all_results = Linear_reg_results_all(data,Genre_list)
     for genre in Genre_list : 
         genre_str ='"' +genre+'"'
         #We do the linear regression 
-        Reg_res = Linear_reg_results(data,Genre_list,genre_str)
+        Reg_res = all_results[genre] if single_fit else Linear_reg_results(data,Genre_list,genre_str)
         Reg_res = Reg_res.sort_values(by='reg_coef',ascending=False)
 
         Reg_res['reg_var'] = Reg_res['reg_var'].str.replace('C(Movie_genres, Treatment('+genre_str+'))[T.', '')
         Reg_res['reg_var'] = Reg_res['reg_var'].str.replace(']', '')
-        best_1 = Reg_res['reg_var'].iloc[0]
-        best_2 = Reg_res['reg_var'].iloc[1]
-        best_3 = Reg_res['reg_var'].iloc[2]
-        worst_1 = Reg_res['reg_var'].iloc[-1]
-        worst_2 = Reg_res['reg_var'].iloc[-2]
-        worst_3 = Reg_res['reg_var'].iloc[-3]
-        if Reg_res['reg_coef'].iloc[0] > 0 and Reg_res['Lower_confidence'].iloc[0] >0 : 
-            res_pos[map(Genre_list,genre)][map(Genre_list,best_1)] += 3 
-        
-        if Reg_res['reg_coef'].iloc[1] > 0 and Reg_res['Lower_confidence'].iloc[1] >0 : 
-            res_pos[map(Genre_list,genre)][map(Genre_list,best_2)] += 2 
-
-        if Reg_res['reg_coef'].iloc[2] > 0 and Reg_res['Lower_confidence'].iloc[2] >0 : 
-            res_pos[map(Genre_list,genre)][map(Genre_list,best_3)] += 1 
-
-        if Reg_res['reg_coef'].iloc[-1] < 0 and Reg_res['Higher_confidence'].iloc[-1] < 0 : 
-            res_neg[map(Genre_list,genre)][map(Genre_list,worst_1)] += -3 
-        
-        if Reg_res['reg_coef'].iloc[-2] < 0 and Reg_res['Higher_confidence'].iloc[-2] < 0 : 
-            res_neg[map(Genre_list,genre)][map(Genre_list,worst_2)] += -2 
-        
-        if Reg_res['reg_coef'].iloc[-3] < 0 and Reg_res['Higher_confidence'].iloc[-3] < 0 : 
-            res_neg[map(Genre_list,genre)][map(Genre_list,worst_3)] += -1 
+        for rank, points in zip([0, 1, 2], [3, 2, 1]) : 
+            if Reg_res['reg_coef'].iloc[rank] > 0 and Reg_res['Lower_confidence'].iloc[rank] >0 : 
+                res_pos[index[genre]][index[Reg_res['reg_var'].iloc[rank]]] += points 
+        for rank, points in zip([-1, -2, -3], [-3, -2, -1]) : 
+            if Reg_res['reg_coef'].iloc[rank] < 0 and Reg_res['Higher_confidence'].iloc[rank] < 0 : 
+                res_neg[index[genre]][index[Reg_res['reg_var'].iloc[rank]]] += points 
             
     return res_pos, res_neg 
 
@@ -139,42 +161,137 @@ def score(lst1,lst2):
             intersect += 1
     return intersect/max(len(lst1),len(lst2))
 
-def matching(genre1, genre2, df):
-
+def _shared_labels(lists1, lists2):
     '''
-    Matches movies of genre 1 with movies of genre 2 whith similar languages and similar country of origin 
-    Returns the dataset containign all the matched samples 
+    Inverted index of the labels (languages or countries) of two series of lists : returns the sparse matrix of
+    the number of elements of each list of lists1 which are in each list of lists2 (only the pairs sharing a label
+    are stored), and the lengths of the lists
+    '''
+    len1 = lists1.str.len().to_numpy()
+    len2 = lists2.str.len().to_numpy()
+    labels1 = lists1.explode()
+    labels2 = lists2.explode()
+    codes, vocabulary = pd.factorize(pd.concat([labels1, labels2]))
+    codes1, codes2 = codes[:len(labels1)], codes[len(labels1):]
+    rows1, rows2 = np.repeat(np.arange(len(lists1)), np.maximum(len1, 1)), np.repeat(np.arange(len(lists2)), np.maximum(len2, 1))
+    keep1, keep2 = codes1 >= 0, codes2 >= 0
+    #Occurrences of each label in the lists of genre 1 and presence in the lists of genre 2
+    counts1 = sparse.csr_matrix((np.ones(keep1.sum()), (rows1[keep1], codes1[keep1])), shape=(len(lists1), len(vocabulary)))
+    binary2 = sparse.csr_matrix((np.ones(keep2.sum()), (rows2[keep2], codes2[keep2])), shape=(len(lists2), len(vocabulary))).sign()
+    return (counts1 @ binary2.T).tocsr(), len1, len2
+
+def candidate_edges(genre1, genre2, df):
+    '''
+    Returns the movie ids of genre 1, the movie ids of genre 2 and the similarity of the pairs of movies whose similarity
+    (in languages and countries, given by score) is above the treshold, in the order of the rows of both genres 
+    Only the pairs of movies sharing at least one language and one country can reach the treshold, they are found 
+    with an inverted index (sparse products)
     '''
     #arbitrary treshold to assure that the movies we are mathcing have a sensible similarity 
     treshold = 1.5
     df_genre1 = df[df['Movie_genres']==genre1]
     df_genre2 = df[df['Movie_genres']==genre2]
-    G = nx.Graph()
-    for idx1, movie1 in df_genre1.iterrows() : 
-        for idx2, movie2 in df_genre2.iterrows() : 
-            if movie2['Wikipedia movie ID'] == movie1['Wikipedia movie ID'] :
-                continue
 
-            similarity = score(movie1['Movie languages'],movie2['Movie languages']) + score(movie1['Movie countries'],movie2['Movie countries'])
-            if similarity >= treshold : 
-                G.add_weighted_edges_from([(movie1['Wikipedia movie ID'], movie2['Wikipedia movie ID'], similarity)])
+    shared_lang, lang_len1, lang_len2 = _shared_labels(df_genre1['Movie languages'], df_genre2['Movie languages'])
+    shared_coun, coun_len1, coun_len2 = _shared_labels(df_genre1['Movie countries'], df_genre2['Movie countries'])
+
+    #Pairs sharing a language and a country, in the order of the rows of both genres 
+    candidates = (shared_lang > 0).multiply(shared_coun > 0)
+    lang = shared_lang.multiply(candidates).tocsr()
+    coun = shared_coun.multiply(candidates).tocsr()
+    lang.sort_indices()
+    coun.sort_indices()
+    i = np.repeat(np.arange(lang.shape[0]), np.diff(lang.indptr))
+    j = lang.indices
+    lang, coun = lang.data, coun.data
+    similarity = lang/np.maximum(lang_len1[i], lang_len2[j]) + coun/np.maximum(coun_len1[i], coun_len2[j])
+
+    ids1 = df_genre1['Wikipedia movie ID'].to_numpy()[i]
+    ids2 = df_genre2['Wikipedia movie ID'].to_numpy()[j]
+    keep = (similarity >= treshold) & (ids1 != ids2)
+    return ids1[keep], ids2[keep], similarity[keep]
+
+def _bipartite_edges(ids1, ids2, similarity):
+    '''
+    Returns the distinct pairs of movies (one row per pair) and the indices of the movies of each side of the bipartite graph 
+    '''
+    edges = pd.DataFrame({'id1': ids1, 'id2': ids2, 'similarity': similarity}).drop_duplicates(['id1', 'id2'])
+    rows, movies1 = pd.factorize(edges['id1'])
+    cols, movies2 = pd.factorize(edges['id2'])
+    return edges, rows, cols, movies1, movies2
 
+def match_edges(ids1, ids2, similarity, method='blossom'):
+    '''
+    Maximum weight matching of the graph of the pairs (ids1, ids2) weighted by similarity, returns the list of the matched pairs 
+    method = 'blossom' : exact matching of the general graph with networkx (former behaviour)
+    method = 'assignment' : exact matching of the bipartite graph (genre 1 vs genre 2) with the assignment solver of scipy, 
+    a movie of both genres can then be matched once on each side 
+    method = 'greedy' : the pairs are taken by decreasing similarity when both movies are free, the matched weight is at 
+    least half of the maximal one (see matching_upper_bound for a bound on a given graph)
+    '''
+    if method == 'blossom':
+        G = nx.Graph()
+        G.add_weighted_edges_from(zip(ids1.tolist(), ids2.tolist(), similarity.tolist()))
+        return list(nx.max_weight_matching(G))
+
+    if method == 'assignment':
+        edges, rows, cols, movies1, movies2 = _bipartite_edges(ids1, ids2, similarity)
+        n1, n2 = len(movies1), len(movies2)
+        if len(edges) == 0:
+            return []
+        #Each movie of genre 1 has a dummy partner (unmatched movie) with a cost higher than any real pair, 
+        #so that a full matching always exists and minimizing the cost maximizes the matched similarity 
+        shift = edges['similarity'].max() + 1
+        costs = np.concatenate([shift - edges['similarity'].to_numpy(), np.full(n1, shift)])
+        biadjacency = sparse.csr_matrix((costs, (np.concatenate([rows, np.arange(n1)]), np.concatenate([cols, n2 + np.arange(n1)]))),
+                                        shape=(n1, n2 + n1))
+        row_ind, col_ind = min_weight_full_bipartite_matching(biadjacency)
+        real = col_ind < n2
+        return list(zip(movies1[row_ind[real]].tolist(), movies2[col_ind[real]].tolist()))
+
+    if method == 'greedy':
+        order = np.argsort(-similarity, kind='stable')
+        used = set()
+        pairs = []
+        for id1, id2 in zip(ids1[order].tolist(), ids2[order].tolist()):
+            if id1 not in used and id2 not in used:
+                used.update((id1, id2))
+                pairs.append((id1, id2))
+        return pairs
+
+    raise ValueError("Unknown matching method " + str(method) + ", expected 'blossom', 'assignment' or 'greedy'")
+
+def matching_upper_bound(ids1, ids2, similarity):
+    '''
+    Upper bound of the weight of any matching of the bipartite graph : each movie of the smallest side is matched at most once, 
+    with at most the similarity of its best pair 
+    '''
+    edges = pd.DataFrame({'id1': ids1, 'id2': ids2, 'similarity': similarity})
+    return min(edges.groupby('id1')['similarity'].max().sum(), edges.groupby('id2')['similarity'].max().sum())
 
-    
-    matching = nx.max_weight_matching(G)
+def matching(genre1, genre2, df, method='blossom'):
+
+    '''
+    Matches movies of genre 1 with movies of genre 2 whith similar languages and similar country of origin 
+    Returns the dataset containign all the matched samples 
+    The matching is done with method ('blossom', 'assignment' or 'greedy', see match_edges)
+    '''
+    ids1, ids2, similarity = candidate_edges(genre1, genre2, df)
+    matching = match_edges(ids1, ids2, similarity, method)
     matched = [i[0] for i in list(matching)] + [i[1] for i in list(matching)]
 
     return df[df['Wikipedia movie ID'].isin(matched) & df['Movie_genres'].isin([genre1,genre2])]
 
 
 
-def Significance_of_genre(data,genre_lst,genre1,genre2):
+def Significance_of_genre(data,genre_lst,genre1,genre2,method='blossom'):
     '''
     Matches movies of genre1 and genre2 together before running a linear regression to asses or not if the two genres have a meaninful influence on the succes of a movie
+    The matching is done with method ('blossom', 'assignment' or 'greedy', see match_edges)
     '''
 
     reg_data = data[data['Movie_genres'].isin(genre_lst)]
-    Matched = matching(genre1,genre2,reg_data)
+    Matched = matching(genre1,genre2,reg_data,method)
     genre_str ='"' +genre1+'"'
     print('Movie_box_office_revenue_scaled ~ C(Movie_genres, Treatment('+genre_str+'))')
     matched_reg = smf.ols(formula='Movie_box_office_revenue_scaled ~ C(Movie_genres, Treatment('+genre_str+'))', data=Matched).fit() 
@@ -191,3 +308,86 @@ def Significance_of_genre(data,genre_lst,genre1,genre2):
     return p_val 
 
 
+
+#Resampling engine for the significance of all the genre pairs 
+
+def two_group_coef(y, in_genre2):
+    '''
+    Closed form of the coefficient of the regression y ~ C(Movie_genres, Treatment(genre1)) on two genres : mean of genre 2 minus mean of genre 1
+    y and in_genre2 can be matrices with one resample per row 
+    '''
+    n2 = in_genre2.sum(axis=-1)
+    n1 = in_genre2.shape[-1] - n2
+    sum2 = (y*in_genre2).sum(axis=-1)
+    return sum2/n2 - (y.sum(axis=-1) - sum2)/n1
+
+def two_group_ols(y, in_genre2):
+    '''
+    Coefficient, standard error and p-value of the regression y ~ C(Movie_genres, Treatment(genre1)) on two genres, as given by smf.ols 
+    '''
+    n2 = in_genre2.sum()
+    n1 = len(y) - n2
+    residuals = np.where(in_genre2, y - y[in_genre2].mean(), y - y[~in_genre2].mean())
+    sigma = np.sqrt((residuals**2).sum()/(len(y) - 2)*(1/n1 + 1/n2))
+    coef = two_group_coef(y, in_genre2)
+    return coef, sigma, 2*stats.t.sf(abs(coef/sigma), len(y) - 2)
+
+def resample_genre_pair(Matched, genre1, genre2, n_resamples=2000, seed=None, alpha=0.05, chunk_size=250):
+    '''
+    Bootstrap confidence interval (percentiles, resampling each genre separately) and permutation p-value (two sided) of the 
+    coefficient of genre2 with genre1 as reference on the matched dataset Matched, with n_resamples resamples done by chunks of chunk_size 
+    The movies without box office revenue are dropped, as smf.ols does 
+    Returns a dict with one entry per column of the results table 
+    '''
+    rng = np.random.default_rng(seed)
+    Matched = Matched[Matched['Movie_box_office_revenue_scaled'].notna()]
+    y = Matched['Movie_box_office_revenue_scaled'].to_numpy(dtype=float)
+    in_genre2 = (Matched['Movie_genres'] == genre2).to_numpy()
+    y1, y2 = y[~in_genre2], y[in_genre2]
+    result = {'genre1': genre1, 'genre2': genre2, 'n_genre1': len(y1), 'n_genre2': len(y2)}
+    if len(y1) < 2 or len(y2) < 2:
+        return result
+
+    coef, sigma, p_val = two_group_ols(y, in_genre2)
+    boot_coefs, perm_coefs = [], []
+    for first in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - first)
+        #Bootstrap : each genre is resampled with replacement 
+        boot_coefs.append(y2[rng.integers(0, len(y2), (size, len(y2)))].mean(axis=1) - y1[rng.integers(0, len(y1), (size, len(y1)))].mean(axis=1))
+        #Permutation : the genre labels are shuffled 
+        perm_coefs.append(two_group_coef(y, rng.permuted(np.tile(in_genre2, (size, 1)), axis=1)))
+    boot_coefs, perm_coefs = np.concatenate(boot_coefs), np.concatenate(perm_coefs)
+
+    result.update({'coef': coef, 'sigma': sigma, 'ols_pvalue': p_val,
+                   'boot_lower': np.quantile(boot_coefs, alpha/2), 'boot_higher': np.quantile(boot_coefs, 1 - alpha/2),
+                   'perm_pvalue': (1 + (np.abs(perm_coefs) >= abs(coef)).sum())/(1 + n_resamples)})
+    return result
+
+def _significance_task(reg_data, genre1, genre2, method, n_resamples, seed, alpha):
+    Matched = matching(genre1, genre2, reg_data, method)
+    return resample_genre_pair(Matched, genre1, genre2, n_resamples, seed, alpha)
+
+def Significance_of_all_genres(data, genre_lst, n_resamples=2000, method='blossom', seed=None, alpha=0.05, n_workers=None):
+    '''
+    Matches the movies of every pair of genres of genre_lst and assesses the difference of success between the two genres with 
+    resample_genre_pair, the pairs being processed in parallel by n_workers processes (all the cores by default) 
+    Each pair has its own random stream spawned from seed, so that the results do not depend on the number of workers 
+    Returns a dataframe with one row per pair (genre1 being the reference) 
+    '''
+    reg_data = data[data['Movie_genres'].isin(genre_lst)]
+    pairs = list(combinations(genre_lst, 2))
+    seeds = np.random.SeedSequence(seed).spawn(len(pairs))
+    tasks = [(reg_data[reg_data['Movie_genres'].isin([genre1, genre2])], genre1, genre2, method, n_resamples, pair_seed, alpha)
+             for (genre1, genre2), pair_seed in zip(pairs, seeds)]
+
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    if n_workers == 1:
+        results = [_significance_task(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_significance_task, *zip(*tasks)))
+
+    results = pd.DataFrame(results)
+    if 'coef' in results:
+        results['significant'] = (results['perm_pvalue'] < alpha) & ((results['boot_lower'] > 0) | (results['boot_higher'] < 0))
+    return results
@@ -1,13 +1,65 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
 OUTPUT_FOLDER_HTML = './IMAGES/html/'
 OUTPUT_FOLDER_WEBSITE_HTML = '../GuillaumeSalha.github.io/img/html/'
 OUTPUT_FOLDER_PNG = './IMAGES/png/'
 OUTPUT_FOLDER_WEBSITE_PNG = '../GuillaumeSalha.github.io/img/png/'
 
-def export_plots(fig, name):
-    fig.write_html(OUTPUT_FOLDER_HTML + name + ".html")
-    fig.write_html(OUTPUT_FOLDER_WEBSITE_HTML + name + ".html")
+HTML_FOLDERS = [OUTPUT_FOLDER_HTML, OUTPUT_FOLDER_WEBSITE_HTML]
+
+# plotly.js is loaded from the CDN (or from a shared local file given as include_plotlyjs) instead of being inlined in every figure
+PLOTLYJS = 'cdn'
+N_WORKERS = 4
+
+# The exports are written in the background, flush_exports waits for them
+_executor = None
+_pending = []
+
+def _write_if_changed(file, content):
+    '''
+    Writes content (bytes) in file, unless the file already has the same content. Returns 'written' or 'unchanged'
+    '''
+    digest = hashlib.sha256(content).digest()
+    if os.path.exists(file) and os.path.getsize(file) == len(content):
+        with open(file, 'rb') as f:
+            if hashlib.sha256(f.read()).digest() == digest:
+                return 'unchanged'
+    with open(file, 'wb') as f:
+        f.write(content)
+    return 'written'
+
+def export_plots(fig, name, folders=None, include_plotlyjs=PLOTLYJS, wait=False):
+    '''
+    Serializes the plotly figure once (with the div id name, so that the html only changes with the figure) and writes
+    it as name.html in each of the folders (the local and website html folders by default) in the background.
+    The files whose content is unchanged are not rewritten. Call flush_exports to wait for the writes (or use wait=True)
+    '''
+    global _executor
+    folders = HTML_FOLDERS if folders is None else folders
+    content = fig.to_html(include_plotlyjs=include_plotlyjs, full_html=True, div_id=name).encode('utf-8')
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=N_WORKERS)
+    futures = [_executor.submit(_write_if_changed, os.path.join(folder, name + ".html"), content) for folder in folders]
+    _pending.extend(futures)
+    if wait:
+        flush_exports()
     #fig.write_image(OUTPUT_FOLDER_PNG + name + ".png")
     #fig.write_image(OUTPUT_FOLDER_WEBSITE_PNG + name + ".png")
 
     # return Image(output_img_folder + name + ".png")
-    #return fig.show()
\ No newline at end of file
+    #return fig.show()
+    return futures
+
+def flush_exports():
+    '''
+    Waits for all the pending exports and returns the number of files written and unchanged
+    (raises the error of the first export which failed, e.g. a missing folder)
+    '''
+    global _pending
+    pending, _pending = _pending, []
+    status = {'written': 0, 'unchanged': 0}
+    for future in pending:
+        status[future.result()] += 1
+    return status
@@ -0,0 +1,123 @@
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from math import isnan
+
+from EXTERNAL_FUNCTIONS import PoolStatistics
+from EXTERNAL_FUNCTIONS.ScoringRelatedFunctions import function_dic, defined_movie_pool, weights_dic
+
+"""
+This file contains a bounded LRU cache of the scores of pools of movies, to be used instead of
+representativeness_score when the same pools are scored again (re-runs, several weight settings...).
+A pool is identified by its sorted movie ids and a hash of the reference distributions and score parameters.
+The sub-scores are stored separately so that new weights only change the aggregation of the cached values.
+A cache is a dict with the keys 'entries' (OrderedDict from the least to the most recently used),
+'max_size', 'hits', 'misses' and 'evictions'.
+"""
+
+MAX_SIZE = 100000
+
+
+def create_score_cache(max_size=MAX_SIZE):
+    """
+    Return an empty cache keeping the sub-scores of at most @max_size pools.
+    """
+    return {'entries': OrderedDict(), 'max_size': max_size, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _update_hash(h, obj):
+    if isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            h.update(repr(key).encode())
+            _update_hash(h, obj[key])
+    elif isinstance(obj, (list, tuple, np.ndarray)):
+        array = np.asarray(obj)
+        h.update(str(array.dtype).encode()+str(array.shape).encode())
+        h.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode())
+    else:
+        h.update(repr(obj).encode())
+
+
+def ref_hash(ref):
+    """
+    Hash of the reference values @ref and of the default parameters (p, sigma...) of the score functions
+    of function_dic. It does not depend on the weights, so that the cached sub-scores are shared between them.
+    """
+    h = hashlib.sha256()
+    _update_hash(h, ref)
+    for key in sorted(function_dic):
+        h.update(key.encode())
+        _update_hash(h, function_dic[key].__defaults__)
+    return h.hexdigest()
+
+
+def pool_key(movies_id):
+    """
+    Canonical identity of a pool: its distinct movie ids, sorted.
+    """
+    return tuple(sorted(set(int(movie_id) for movie_id in movies_id)))
+
+
+def _compute_scores(movies_id, keys, df, ref, stats):
+    if stats is not None:
+        positions = PoolStatistics.movie_positions(movies_id, stats)[np.newaxis, :]
+        scores = PoolStatistics.counts_scores(PoolStatistics.pools_counts(stats, positions), ref, keys)
+        return {key: float(value[0]) for key, value in scores.items()}
+    pool = defined_movie_pool(movies_id, df)
+    return {key: (function_dic[key](pool)[key] if key == 'div' else function_dic[key](pool, ref[key])[key])
+            for key in keys}
+
+
+def cached_representativeness_score(movies_id, df, ref, cache, weights=weights_dic, stats=None):
+    """
+    Same result as representativeness_score(defined_movie_pool(@movies_id, df), @ref, @weights), the sub-scores
+    being taken from @cache when the pool was already scored with the same @ref. The missing sub-scores are
+    computed with the functions of function_dic, or from @stats = PoolStatistics.build_movie_statistics(df) if given.
+    """
+    key = (pool_key(movies_id), ref_hash(ref))
+    entries = cache['entries']
+    scores = entries.get(key)
+    missing = list(weights) if scores is None else [score_id for score_id in weights if score_id not in scores]
+
+    if scores is not None and not missing:
+        cache['hits'] += 1
+        entries.move_to_end(key)
+    else:
+        cache['misses'] += 1
+        scores = {} if scores is None else scores
+        scores.update(_compute_scores(key[0], missing, df, ref, stats))
+        entries[key] = scores
+        entries.move_to_end(key)
+        while len(entries) > cache['max_size']:
+            entries.popitem(last=False)
+            cache['evictions'] += 1
+
+    return aggregate(scores, weights)
+
+
+def aggregate(scores, weights=weights_dic):
+    """
+    Weighted aggregation of the cached sub-scores @scores, as done by representativeness_score.
+    """
+    result = {key: scores[key] for key in weights}
+    agg_score = sum(weights[key]*scores[key] for key in weights)/sum(weights.values())
+    result['tot'] = 0 if isnan(agg_score) else int(agg_score*100)
+    return result
+
+
+def cache_info(cache):
+    """
+    Return the counters of @cache: hits, misses, evictions, current size and hit rate.
+    """
+    calls = cache['hits']+cache['misses']
+    return {'hits': cache['hits'], 'misses': cache['misses'], 'evictions': cache['evictions'],
+            'size': len(cache['entries']), 'max_size': cache['max_size'],
+            'hit_rate': cache['hits']/calls if calls else 0.}
+
+
+def clear_cache(cache):
+    """
+    Remove all the entries of @cache and reset its counters.
+    """
+    cache['entries'].clear()
+    cache['hits'] = cache['misses'] = cache['evictions'] = 0